@@ -1,28 +1,386 @@
 import operator
 import os
+import re
+import time
+import shutil
+import heapq
+import hashlib
+import logging
+import threading
+import concurrent.futures
 import keyring
 import requests
-from requests import auth
+from requests import auth, adapters
+import yaml
 
-from utils import log
+from utils import stream
 import config
 
 
-class FsClient(requests.Session, log.Logger):
-    """Class derived from :class:`requests.Session` with some custom methods.
+class PackageCache:
+    """Content-addressed storage of downloaded packages in download_dir.
+
+    Every package is kept in a sub-directory named after its server checksum
+    (or ETag), so different builds with the same file name never overwrite
+    each other. Sizes and last use times are stored in an index file; least
+    recently deployed packages are evicted once cache_size is exceeded.
+
+    :ivar lock: lock guarding index
+    :ivar index: dict key -> {'name', 'size', 'mtime', 'digest', 'used'}
+    :ivar pinned: keys used by current deployment run, never evicted
     """
+    INDEX = 'cache.yaml'
+
     def __init__(self):
+        self.lock = threading.RLock()
+        self.index = None
+        self.pinned = set()
+
+    @staticmethod
+    def get_dir() -> str:
+        """Get cache directory.
+
+        :return: absolute path to download_dir
+        :rtype: str
+        """
+        return os.path.abspath(config.conf['download_dir'])
+
+    def get_path(self, key: str, name: str) -> str:
+        """Get absolute path to a cached package.
+
+        :param key: package's checksum
+        :type key: str
+
+        :param name: package's file name
+        :type name: str
+
+        :return: path to package
+        :rtype: str
+        """
+        return os.path.join(self.get_dir(), key, name)
+
+    def load(self) -> dict:
+        """Load index from download_dir (only once).
+
+        :return: index
+        :rtype: dict
+        """
+        if self.index is None:
+            self.index = {}
+            index_file = os.path.join(self.get_dir(), self.INDEX)
+            if os.path.isfile(index_file):
+                try:
+                    with open(index_file, 'r', encoding='utf-8') as stream:
+                        self.index = yaml.safe_load(stream) or {}
+                except Exception as e:
+                    logging.error(f'{__name__}: {index_file} is broken')
+                    logging.error(str(e))
+        return self.index
+
+    def save(self) -> None:
+        """Save index to download_dir.
+        """
+        index_file = os.path.join(self.get_dir(), self.INDEX)
+        with open(f'{index_file}.tmp', 'w', encoding='utf-8') as stream:
+            yaml.safe_dump(self.index, stream)
+        os.replace(f'{index_file}.tmp', index_file)
+
+    def get(self, key: str, name: str):
+        """Get cached package if a verified copy is present.
+
+        Size and modification time of the file must match the ones recorded
+        when the package was downloaded and verified.
+
+        :param key: package's checksum
+        :type key: str
+
+        :param name: package's file name
+        :type name: str
+
+        :return: path to package relative to download_dir or None
+        :rtype: Union[str, None]
+        """
+        with self.lock:
+            entry = self.load().get(key)
+            path = self.get_path(key, name)
+            if not entry or entry['name'] != name or not os.path.isfile(path):
+                return None
+            stat = os.stat(path)
+            if stat.st_size != entry['size'] or \
+                    stat.st_mtime != entry['mtime']:
+                return None
+            entry['used'] = time.time()
+            self.pinned.add(key)
+            self.save()
+            return os.path.join(key, name)
+
+    def put(self, key: str, name: str, digest: str) -> str:
+        """Register downloaded package and evict expired ones.
+
+        :param key: package's checksum
+        :type key: str
+
+        :param name: package's file name
+        :type name: str
+
+        :param digest: checksum computed while downloading
+        :type digest: str
+
+        :return: path to package relative to download_dir
+        :rtype: str
+        """
+        with self.lock:
+            stat = os.stat(self.get_path(key, name))
+            self.load()[key] = {
+                'name': name,
+                'size': stat.st_size,
+                'mtime': stat.st_mtime,
+                'digest': digest,
+                'used': time.time()
+            }
+            self.pinned.add(key)
+            self.evict()
+            self.save()
+            return os.path.join(key, name)
+
+    def evict(self) -> None:
+        """Remove least recently used packages until cache fits cache_size.
+        """
+        budget = config.conf['cache_size'] * 1024 * 1024
+        total = sum(entry['size'] for entry in self.index.values())
+        for key, entry in sorted(self.index.items(),
+                                 key=lambda item: item[1]['used']):
+            if total <= budget:
+                break
+            if key in self.pinned:
+                continue
+            shutil.rmtree(os.path.join(self.get_dir(), key),
+                          ignore_errors=True)
+            del self.index[key]
+            total -= entry['size']
+            logging.info(f'{__name__}: evicted {entry["name"]} ({key})')
+
+    def unpin(self) -> None:
+        """Allow eviction of packages used by finished deployment run.
+        """
+        with self.lock:
+            self.pinned.clear()
+
+
+class RangeDownload:
+    """Resumable download of a file split into byte ranges fetched
+    concurrently through one session.
+
+    Every range is streamed straight into ``<path>.part``; progress of all
+    ranges is kept in ``<path>.part.yaml``, so an interrupted download is
+    resumed from where it stopped. Checksum is computed while downloading:
+    the calling thread follows the contiguous downloaded part of the file
+    and reports it to readers of the growing file, if any.
+
+    :ivar session: session to use
+    :ivar url: file's URL
+    :ivar path: where to save file
+    :ivar size: file's size
+    :ivar validator: ETag or Last-Modified of the file
+    :ivar ranges: list of [start, end, done] (end is inclusive)
+    :ivar cond: condition notified on progress
+    :ivar save_lock: lock guarding state file
+    :ivar error: exception raised by any range
+    :ivar growing: file followed by readers or None
+    """
+    CHUNK_SIZE = 1024 * 1024
+    MIN_RANGE = 8 * 1024 * 1024
+    SAVE_EVERY = 16
+
+    def __init__(self, session: requests.Session, url: str, path: str,
+                 size: int, validator: str, threads: int,
+                 growing: stream.GrowingFile = None):
+        self.session = session
+        self.url = url
+        self.path = path
+        self.part = f'{path}.part'
+        self.state = f'{path}.part.yaml'
+        self.size = size
+        self.validator = validator
+        self.cond = threading.Condition()
+        self.save_lock = threading.Lock()
+        self.error = None
+        self.growing = growing
+        self.ranges = self.load()
+        if self.ranges is None:
+            count = max(1, min(threads, size // self.MIN_RANGE))
+            step = -(-size // count)
+            self.ranges = [[start, min(start + step, size) - 1, 0]
+                           for start in range(0, size, step)]
+            with open(self.part, 'wb') as f:
+                f.truncate(size)
+
+    def load(self):
+        """Load progress of a previous attempt if it downloads the same file.
+
+        :return: list of ranges or None
+        :rtype: Union[list, None]
+        """
+        if not self.validator or not os.path.isfile(self.state) or \
+                not os.path.isfile(self.part):
+            return None
+        try:
+            with open(self.state, 'r', encoding='utf-8') as stream:
+                state = yaml.safe_load(stream)
+        except Exception:
+            return None
+        if state.get('url') != self.url or state.get('size') != self.size or \
+                state.get('validator') != self.validator:
+            return None
+        return state['ranges']
+
+    def save(self) -> None:
+        """Save progress of all ranges.
+        """
+        with self.cond:
+            state = {
+                'url': self.url,
+                'size': self.size,
+                'validator': self.validator,
+                'ranges': [list(r) for r in self.ranges]
+            }
+        with self.save_lock:
+            with open(f'{self.state}.tmp', 'w', encoding='utf-8') as stream:
+                yaml.safe_dump(state, stream)
+            os.replace(f'{self.state}.tmp', self.state)
+
+    def get_frontier(self) -> int:
+        """Get end of contiguous downloaded part of the file.
+
+        :return: offset
+        :rtype: int
+        """
+        for start, end, done in self.ranges:
+            if start + done <= end:
+                return start + done
+        return self.size
+
+    def fetch_range(self, r: list) -> None:
+        """Download one range; stop early once another range has failed
+        (progress is saved by :meth:`run` for resumption).
+
+        :param r: range [start, end, done]
+        :type r: list
+        """
+        try:
+            start, end, done = r
+            if start + done > end:
+                return
+            headers = {'Range': f'bytes={start + done}-{end}'}
+            with self.session.get(self.url, headers=headers,
+                                  stream=True) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise requests.HTTPError(
+                        f'range request is not supported by {self.url}')
+                with open(self.part, 'r+b') as f:
+                    f.seek(start + done)
+                    for n, chunk in enumerate(
+                            response.iter_content(self.CHUNK_SIZE), 1):
+                        f.write(chunk)
+                        f.flush()
+                        with self.cond:
+                            r[2] += len(chunk)
+                            self.cond.notify_all()
+                            failed = self.error is not None
+                        if failed:
+                            return
+                        if n % self.SAVE_EVERY == 0:
+                            self.save()
+        except BaseException as e:
+            with self.cond:
+                self.error = self.error or e
+                self.cond.notify_all()
+            raise
+
+    def run(self) -> str:
+        """Download all ranges.
+
+        :return: hex digest of downloaded file
+        :rtype: str
+        """
+        digest = hashlib.new(config.conf['checksum'])
+        executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(self.ranges))
+        futures = [executor.submit(self.fetch_range, r) for r in self.ranges]
+        try:
+            offset = 0
+            with open(self.part, 'rb') as f:
+                while offset < self.size:
+                    with self.cond:
+                        while self.error is None and \
+                                self.get_frontier() <= offset:
+                            self.cond.wait()
+                        if self.error is not None:
+                            raise self.error
+                        frontier = self.get_frontier()
+                    f.seek(offset)
+                    while offset < frontier:
+                        chunk = f.read(min(self.CHUNK_SIZE, frontier - offset))
+                        digest.update(chunk)
+                        offset += len(chunk)
+                    if self.growing is not None:
+                        self.growing.update(offset)
+        finally:
+            executor.shutdown(wait=True)
+            self.save()
+        for future in futures:
+            future.result()
+        if self.growing is not None:
+            self.growing.move()
+        else:
+            os.replace(self.part, self.path)
+        os.remove(self.state)
+        return digest.hexdigest()
+
+
+cache = PackageCache()
+
+
+class FsClient(requests.Session):
+    """Class derived from :class:`requests.Session` with some custom methods.
+
+    One instance is shared by all workers of a deployment, so connections
+    are pooled and kept alive between requests.
+
+    :ivar lock: lock guarding listings
+    :ivar listings: dict (mask, edition) -> cached search result
+    """
+    CHUNK_SIZE = 1024 * 1024
+    TOP = 1
+
+    def __init__(self, pool_size: int = 10):
+        """
+        :param pool_size: max number of connections kept per host
+        :type pool_size: int
+        """
         super().__init__()
+        adapter = adapters.HTTPAdapter(pool_connections=1,
+                                       pool_maxsize=pool_size)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        self.lock = threading.Lock()
+        self.listings = {}
+        self.login()
+        if not os.path.isdir(config.conf['download_dir']):
+            os.mkdir(config.conf['download_dir'])
+
+    def login(self) -> None:
+        """Resolve credentials to access file server.
+        """
         self.auth = auth.HTTPBasicAuth(
             config.conf['username'],
             keyring.get_password('system', config.conf['username'])
         )
-        self.device = None
-        if not os.path.isdir(config.conf['download_dir']):
-            os.mkdir(config.conf['download_dir'])
 
     @staticmethod
-    def sort_packages(packages: list, reverse: bool = True) -> list:
+    def sort_packages(packages: list, reverse: bool = True,
+                      k: int = None) -> list:
         """Sort list of dict objects (packages) using key 'some_key'.
 
         :param packages: list of package objects
@@ -31,34 +389,193 @@ class FsClient(requests.Session, log.Logger):
         :param reverse: sort order (descending by default)
         :type reverse: bool
 
+        :param k: number of first packages to select without sorting the
+                  whole list (all packages by default)
+        :type k: int
+
         :return: sorted list of package objects
         :rtype: list
         """
         # TODO: define key
-        return \
-            sorted(packages, key=operator.itemgetter('some_key'), reverse=reverse)
+        key = operator.itemgetter('some_key')
+        if k is None:
+            return sorted(packages, key=key, reverse=reverse)
+        if reverse:
+            return heapq.nlargest(k, packages, key=key)
+        return heapq.nsmallest(k, packages, key=key)
+
+    def request_packages(self, device: dict,
+                         headers: dict) -> requests.Response:
+        """Send search request for device's packages.
+
+        :param device: device's data
+        :type device: dict
+
+        :param headers: extra headers (conditional request)
+        :type headers: dict
+
+        :return: server's response
+        :rtype: requests.Response
+        """
+        # TODO: code depends on server's API; must be implemented
+        raise NotImplementedError
 
     def search_packages(self, device: dict) -> list:
         """Get list of packages using search.
 
+        Listings are cached by (ptype mask, edition) for listing_ttl seconds;
+        expired listings are revalidated with a conditional request.
+
         :param device: device's data
         :type device: dict
 
-        :return: list of packages
+        :return: latest packages, newest first
         :rtype: list
         """
-        self.device = device
-        # TODO: code depends on server's API; must be implemented
-        raise NotImplementedError
+        key = (config.conf['ptypes'][device['ptype']]['mask'],
+               device['edition'])
+        with self.lock:
+            entry = self.listings.get(key)
+        if entry and time.time() - entry['time'] < config.conf['listing_ttl']:
+            return entry['packages']
+
+        headers = {}
+        if entry and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry and entry['modified']:
+            headers['If-Modified-Since'] = entry['modified']
+        response = self.request_packages(device, headers)
+        if entry and response.status_code == 304:
+            entry['time'] = time.time()
+            return entry['packages']
+        response.raise_for_status()
 
-    def download_package(self, package: dict) -> str:
-        """Download package from server.
+        # TODO: code depends on server's API; JSON list is assumed
+        entry = {
+            'time': time.time(),
+            'etag': response.headers.get('ETag'),
+            'modified': response.headers.get('Last-Modified'),
+            'packages': self.sort_packages(response.json(), k=self.TOP)
+        }
+        with self.lock:
+            self.listings[key] = entry
+        return entry['packages']
+
+    def get_checksum(self, package: dict) -> str:
+        """Get package's checksum reported by server (or ETag of its URL).
 
         :param package: package's data
         :type package: dict
 
-        :return: name of downloaded package
+        :return: checksum usable as a directory name
         :rtype: str
         """
-        # TODO: code depends on server's API; must be implemented
-        raise NotImplementedError
+        # TODO: code depends on server's API; 'checksum' and 'url' are assumed
+        checksum = package.get('checksum')
+        if not checksum:
+            response = self.head(package['url'], allow_redirects=True)
+            response.raise_for_status()
+            checksum = response.headers['ETag']
+        checksum = re.sub(r'^W/', '', checksum).strip('"')
+        return re.sub(r'[^\w.-]', '_', checksum)
+
+    def fetch(self, url: str, path: str,
+              growing: stream.GrowingFile = None) -> str:
+        """Download file from server.
+
+        Files served with Content-Length and range support are downloaded by
+        :class:`RangeDownload`, others are streamed in one request.
+
+        :param url: file's URL
+        :type url: str
+
+        :param path: where to save file
+        :type path: str
+
+        :param growing: file to report progress to
+        :type growing: stream.GrowingFile
+
+        :return: hex digest of downloaded file
+        :rtype: str
+        """
+        response = self.head(url, allow_redirects=True)
+        response.raise_for_status()
+        size = response.headers.get('Content-Length')
+        if size and int(size) and \
+                response.headers.get('Accept-Ranges') == 'bytes':
+            validator = response.headers.get('ETag') or \
+                response.headers.get('Last-Modified')
+            if growing is not None:
+                growing.set_size(int(size))
+            return RangeDownload(self, url, path, int(size), validator,
+                                 config.conf['download_threads'],
+                                 growing).run()
+
+        digest = hashlib.new(config.conf['checksum'])
+        part = f'{path}.part'
+        with self.get(url, stream=True) as response:
+            response.raise_for_status()
+            size = response.headers.get('Content-Length')
+            if growing is not None and size and \
+                    'Content-Encoding' not in response.headers:
+                growing.set_size(int(size))
+            with open(part, 'wb') as f:
+                for chunk in response.iter_content(self.CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    if growing is not None:
+                        f.flush()
+                        growing.update(f.tell())
+        if growing is not None:
+            growing.move()
+        else:
+            os.replace(part, path)
+        return digest.hexdigest()
+
+    def download_package(self, package: dict, on_start=None) -> str:
+        """Download package from server unless it is already in cache.
+
+        :param package: package's data
+        :type package: dict
+
+        :param on_start: callable called with package path relative to
+                         download_dir and :class:`stream.GrowingFile` as soon
+                         as the download starts, so that the package can be
+                         read while it is being downloaded
+        :type on_start: Callable
+
+        :return: path to downloaded package relative to download_dir
+        :rtype: str
+        """
+        # TODO: code depends on server's API; 'name' and 'url' are assumed
+        key = self.get_checksum(package)
+        name = package['name']
+        cached = cache.get(key, name)
+        if cached:
+            logging.info(f'{__name__}: {name} found in cache')
+            if on_start is not None:
+                path = cache.get_path(key, name)
+                growing = stream.GrowingFile(path, path)
+                growing.finish()
+                on_start(cached, growing)
+            return cached
+        path = cache.get_path(key, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        growing = stream.GrowingFile(f'{path}.part', path)
+        if on_start is not None:
+            on_start(os.path.join(key, name), growing)
+        logging.info(f'{__name__}: downloading {name} ...')
+        try:
+            digest = self.fetch(package['url'], path, growing)
+            if package.get('checksum') and \
+                    package['checksum'].lower() != digest:
+                with growing.exclusive():
+                    os.remove(path)
+                raise ValueError(f'checksum mismatch for {name}')
+        except BaseException as e:
+            growing.finish(e)
+            raise
+        logging.info(f'{__name__}: {name} downloaded')
+        cached = cache.put(key, name, digest)
+        growing.finish()
+        return cached
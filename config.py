@@ -8,8 +8,33 @@ DEFAULTS = {
     'fileserver_url': 'https://fileserver.stable.team',
     'username': 'ar_user',
     'download_dir': './downloads',
+    'cache_size': 10240,
+    'checksum': 'md5',
+    'download_threads': 4,
+    'listing_ttl': 60,
+    'engine': 'pipeline',
+    'ssh_keepalive': 30,
+    'ssh_idle_timeout': 600,
+    'delta_block_size': 131072,
+    'delta_max_ratio': 0.5,
+    'sftp_window_size': 33554432,
+    'sftp_channels': 4,
+    'stream_extract': False,
+    'smb_workers': 8,
+    'shared_host_sync': False,
+    'web_put_archive': False,
+    'web_warm': False,
+    'windows_pull': False,
+    'serve_port': 8765,
+    'tee_stream': False,
     'bundletool': './utils/bundletool/bundletool.jar',
     'aab_key': './utils/bundletool/default_aab_key.jks',
+    'concurrency': {
+        'total': 3,
+        'host': 2,
+        'hosts': {},
+        'drivers': {}
+    },
     'ptypes': {
         'win64': {
             'mask': 'win64.exe',
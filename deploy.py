@@ -1,18 +1,167 @@
+from typing import Union
+import os
 import ctypes
+import asyncio
 import platform
 import threading
 import logging
+import logging.handlers
+import functools
+import collections
+import multiprocessing
 import concurrent.futures
 
-from utils import log
+from utils import log, serve, stream
 import config
 import client
 import drivers
 
 
+class LogForwarder(logging.Handler):
+    """Handler passing log records received from child processes to
+    loggers of current process.
+    """
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+
+class Downloads:
+    """Registry of packages downloaded during one deployment run.
+
+    Devices sharing the same ptype and edition need the same package, so only
+    the first worker asking for it searches and downloads it; the others wait
+    for the in-flight download and reuse its result. With tee_stream,
+    workers may start as soon as the download starts and read the package
+    while it grows.
+
+    :ivar fs_client: client to file server
+    :ivar lock: lock guarding futures
+    :ivar futures: dict (ptype, edition) -> concurrent.futures.Future with
+                   name of downloaded package
+    :ivar streams: dict (ptype, edition) -> concurrent.futures.Future with
+                   (name of package, stream.GrowingFile) set once download
+                   starts
+    """
+    def __init__(self, fs_client: client.FsClient):
+        self.fs_client = fs_client
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.streams = {}
+
+    @staticmethod
+    def get_key(device: dict) -> tuple:
+        """Get key of a package required by a device.
+
+        :param device: device's params
+        :type device: dict
+
+        :return: (ptype, edition)
+        :rtype: tuple
+        """
+        return device['ptype'], device['edition']
+
+    def get_package(self, device: dict) -> str:
+        """Get package for a device, downloading it only once per run.
+
+        :param device: device's params
+        :type device: dict
+
+        :return: name of downloaded package
+        :rtype: str
+        """
+        key = self.get_key(device)
+        with self.lock:
+            future = self.futures.get(key)
+            owner = future is None
+            if owner:
+                future = concurrent.futures.Future()
+                self.futures[key] = future
+        if owner:
+            started = self.get_started(device)
+            try:
+                packages = self.fs_client.search_packages(device)
+                future.set_result(self.fs_client.download_package(
+                    packages[0],
+                    lambda *args: started.set_result(args)))
+            except BaseException as e:
+                future.set_exception(e)
+                if not started.done():
+                    started.set_exception(e)
+        return future.result()
+
+    async def aget_package(self, device: dict) -> str:
+        """Coroutine version of :meth:`get_package`; waiting for a download
+        in flight takes no executor thread.
+
+        :param device: device's params
+        :type device: dict
+
+        :return: name of downloaded package
+        :rtype: str
+        """
+        with self.lock:
+            future = self.futures.get(self.get_key(device))
+        if future is None:
+            return await asyncio.get_running_loop().run_in_executor(
+                None, self.get_package, device)
+        return await asyncio.wrap_future(future)
+
+    def get_started(self, device: dict) -> concurrent.futures.Future:
+        """Get future set once download of device's package starts.
+
+        :param device: device's params
+        :type device: dict
+
+        :return: future with (name of package, stream.GrowingFile)
+        :rtype: concurrent.futures.Future
+        """
+        with self.lock:
+            return self.streams.setdefault(self.get_key(device),
+                                           concurrent.futures.Future())
+
+    def get_stream(self, device: dict) -> tuple:
+        """Get package for a device without waiting for its download to
+        complete; download it in background unless it is in flight.
+
+        :param device: device's params
+        :type device: dict
+
+        :return: (name of package, stream.GrowingFile)
+        :rtype: tuple
+        """
+        with self.lock:
+            idle = self.get_key(device) not in self.futures
+        if idle:
+            # named as executor threads, so that stop_deploy ends it too
+            threading.Thread(target=self.download, args=(device,),
+                             name=f'DownloadExecutor-{device["ptype"]}',
+                             daemon=True).start()
+        return self.get_started(device).result()
+
+    def download(self, device: dict) -> None:
+        """Download device's package; errors are reported to workers
+        waiting for it.
+
+        :param device: device's params
+        :type device: dict
+        """
+        try:
+            self.get_package(device)
+        except BaseException:
+            pass
+
+
 class Worker(log.Logger):
     """Class-worker which performs package-to-device deployment.
+
+    :ivar downloads: packages of current deployment run
     """
+    TEE = True
+
+    def __init__(self, downloads: Downloads):
+        super().__init__()
+        self.downloads = downloads
+
     def deploy(self, device: dict):
         """Deploy package to a device.
 
@@ -21,25 +170,327 @@ class Worker(log.Logger):
         """
         self.device = device
         try:
-            fs_client = client.FsClient()
-            packages = fs_client.list_packages(self.device)
-            package = fs_client.download_package(packages[0])
+            if config.conf['tee_stream'] and self.TEE:
+                self.run_driver(*self.downloads.get_stream(self.device))
+            else:
+                self.run_driver(self.downloads.get_package(self.device))
+        except IndexError:
+            self.printl(f'{self.device["ptype"]} not found')
+            self.printl('! ! ! ! ! ! Deployment failed')
+        except Exception as e:
+            self.printl(str(e))
+            self.printl('! ! ! ! ! ! Deployment failed')
+
+    def run_driver(self, package: str,
+                   growing: stream.GrowingFile = None) -> None:
+        """Deploy downloaded package with device's driver.
+
+        :param package: package's path relative to download_dir
+        :type package: str
+
+        :param growing: package while it is being downloaded
+        :type growing: stream.GrowingFile
+        """
+        driver = config.conf['ptypes'][self.device['ptype']]['driver']
+        driver = drivers.DRIVERS[driver](self.device, package)
+        driver.growing = growing
+        driver.deploy()
+
+    async def adeploy(self, device: dict):
+        """Deploy package to a device (coroutine for asyncio engine).
+
+        :param device: device's params
+        :type device: dict
+        """
+        self.device = device
+        loop = asyncio.get_running_loop()
+        try:
+            if config.conf['tee_stream']:
+                package, growing = await loop.run_in_executor(
+                    None, self.downloads.get_stream, self.device)
+            else:
+                package = await self.downloads.aget_package(self.device)
+                growing = None
             driver = config.conf['ptypes'][self.device['ptype']]['driver']
-            drivers.DRIVERS[driver](self.device, package).deploy()
+            driver = drivers.DRIVERS[driver](self.device, package)
+            driver.growing = growing
+            await driver.adeploy()
         except IndexError:
             self.printl(f'{self.device["ptype"]} not found')
             self.printl('! ! ! ! ! ! Deployment failed')
+        except asyncio.CancelledError:
+            self.printl('! ! ! ! ! ! Deployment interrupted')
+            raise
         except Exception as e:
             self.printl(str(e))
             self.printl('! ! ! ! ! ! Deployment failed')
 
 
+class Job(log.Logger):
+    """Deployment of one device passing through stages of pipeline engine.
+
+    :ivar driver: device's driver
+    :ivar fetched: concurrent.futures.Future with name of device's package
+                   (or with (name, stream.GrowingFile) with tee_stream)
+    """
+    STAGES = ('connect', 'transfer', 'install')
+
+    def __init__(self, device: dict, fetched: concurrent.futures.Future):
+        super().__init__()
+        self.device = device
+        self.fetched = fetched
+        driver = config.conf['ptypes'][device['ptype']]['driver']
+        # package is set once it is fetched
+        self.driver = drivers.DRIVERS[driver](device, '')
+
+    def connect(self) -> bool:
+        """Connect to device and perform clean-up if required.
+
+        :return: True on success and False on failure
+        :rtype: bool
+        """
+        if not self.driver.connect():
+            return False
+        if self.device['cleanup']:
+            self.driver.cleanup()
+        return True
+
+    def transfer(self) -> bool:
+        """Wait for package (only until its download starts with
+        tee_stream, unless driver cannot stream it) and transfer it.
+
+        :return: True on success and False on failure
+        :rtype: bool
+        """
+        try:
+            result = self.fetched.result()
+        except concurrent.futures.CancelledError:
+            self.printl('interrupted')
+            return False
+        except IndexError:
+            self.printl(f'{self.device["ptype"]} not found')
+            return False
+        package, growing = result if isinstance(result, tuple) \
+            else (result, None)
+        self.driver.set_package(package)
+        self.driver.growing = growing
+        self.driver.wait_package()
+        return self.driver.transfer()
+
+    def install(self) -> bool:
+        """Install transferred package.
+
+        :return: True on success and False on failure
+        :rtype: bool
+        """
+        return self.driver.install()
+
+    def finish(self, result: bool) -> None:
+        """Release connection and report result.
+
+        :param result: True if all stages succeeded
+        :type result: bool
+        """
+        try:
+            self.driver.disconnect()
+        finally:
+            if result:
+                self.printl('+ + + + + + Deployment succeeded')
+            else:
+                self.printl('! ! ! ! ! ! Deployment failed')
+
+
+def run_process(device: dict, package: str, queue) -> None:
+    """Entry point of a child process deploying one device. The process
+    leads its own session, so it can be killed together with all its
+    subprocesses; log records are sent to the parent through a queue.
+
+    :param device: device's params
+    :type device: dict
+
+    :param package: package's path relative to download_dir
+    :type package: str
+
+    :param queue: multiprocessing queue for log records
+    """
+    if os.name != 'nt':
+        os.setsid()
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(queue)]
+    root.setLevel(logging.INFO)
+    worker = Worker(None)
+    worker.device = device
+    try:
+        worker.run_driver(package)
+    except Exception as e:
+        worker.printl(str(e))
+        worker.printl('! ! ! ! ! ! Deployment failed')
+
+
+class IsolatedWorker(Worker):
+    """Class-worker which runs driver in a child process. A child cannot
+    follow a download of the parent, so it gets complete packages only.
+
+    :ivar context: multiprocessing context
+    :ivar queue: queue for log records of child processes
+    :ivar processes: list of running child processes
+    """
+    TEE = False
+
+    def __init__(self, downloads: Downloads, context, queue, processes: list):
+        super().__init__(downloads)
+        self.context = context
+        self.queue = queue
+        self.processes = processes
+
+    def run_driver(self, package: str,
+                   growing: stream.GrowingFile = None) -> None:
+        process = self.context.Process(
+            target=run_process,
+            args=(self.device, package, self.queue),
+            name=f'integra-{self.device["name"]}',
+            daemon=True
+        )
+        process.start()
+        self.processes.append(process)
+        try:
+            process.join()
+        finally:
+            self.processes.remove(process)
+        if process.exitcode:
+            self.printl(f'worker process exited with {process.exitcode}')
+            self.printl('! ! ! ! ! ! Deployment failed')
+
+
+class Limits:
+    """Concurrency limits of a deployment run, see 'concurrency' in
+    config.yaml: total number of deployments, deployments per driver and
+    deployments per target host.
+
+    :ivar busy: collections.Counter of running deployments per key
+    """
+    def __init__(self):
+        self.conf = config.conf['concurrency']
+        self.busy = collections.Counter()
+
+    @property
+    def total(self) -> int:
+        return self.conf['total']
+
+    @staticmethod
+    def get_keys(device: dict) -> list:
+        """Get keys of resources shared by deployments.
+
+        :param device: device's params
+        :type device: dict
+
+        :return: list of ('driver', name) and ('host', name)
+        :rtype: list
+        """
+        keys = []
+        driver = config.conf['ptypes'].get(device['ptype'], {}).get('driver')
+        if driver:
+            keys.append(('driver', driver))
+        host = drivers.get_host(device)
+        if host:
+            keys.append(('host', host))
+        return keys
+
+    def get_workers(self, stage: str) -> int:
+        """Get number of worker threads of a pipeline stage ('fetch',
+        'connect', 'transfer' or 'install'); defaults to total limit.
+
+        :param stage: stage name
+        :type stage: str
+
+        :return: number of threads
+        :rtype: int
+        """
+        return self.conf.get('stages', {}).get(stage, self.total)
+
+    def get_limit(self, key: tuple) -> Union[int, None]:
+        """Get limit for a key.
+
+        :param key: ('driver', name) or ('host', name)
+        :type key: tuple
+
+        :return: max number of deployments or None if unlimited
+        :rtype: Union[int, None]
+        """
+        kind, name = key
+        if kind == 'driver':
+            return self.conf.get('drivers', {}).get(name)
+        return self.conf.get('hosts', {}).get(name, self.conf.get('host'))
+
+    def fits(self, device: dict) -> bool:
+        """Check if a device can be deployed right now.
+
+        :param device: device's params
+        :type device: dict
+
+        :return: True if no limit is reached
+        :rtype: bool
+        """
+        if self.busy['total'] >= self.total:
+            return False
+        for key in self.get_keys(device):
+            limit = self.get_limit(key)
+            if limit is not None and self.busy[key] >= limit:
+                return False
+        return True
+
+    def take(self, device: dict) -> None:
+        """Count a started deployment.
+
+        :param device: device's params
+        :type device: dict
+        """
+        self.busy['total'] += 1
+        for key in self.get_keys(device):
+            self.busy[key] += 1
+
+    def free(self, device: dict) -> None:
+        """Count a finished deployment.
+
+        :param device: device's params
+        :type device: dict
+        """
+        self.busy['total'] -= 1
+        for key in self.get_keys(device):
+            self.busy[key] -= 1
+
+
 class Foreman:
     """Class-foreman which controls deployment procedure.
+
+    Devices are dispatched to the executor only when their driver and host
+    limits allow it, so a device waiting for a busy resource never holds a
+    worker.
+
+    :ivar executors: thread pools of current run
+    :ivar stages: thread pools of pipeline stages
+    :ivar remaining: number of devices of pipeline engine not finished yet
+    :ivar fs_client: client to file server shared by all deployments
+    :ivar limits: concurrency limits of current run
+    :ivar cond: condition notified when a deployment finishes
+    :ivar stopped: deployment is being interrupted
+    :ivar loop: event loop of asyncio engine
+    :ivar task: main task of asyncio engine
+    :ivar processes: child processes of processes engine
     """
     def __init__(self):
         self.executor = None
+        self.executors = []
+        self.stages = {}
+        self.remaining = 0
         self.futures = None
+        self.fs_client = None
+        self.limits = None
+        self.cond = threading.Condition()
+        self.stopped = False
+        self.loop = None
+        self.task = None
+        self.processes = []
 
     def start_deploy(self, devices: list, button):
         """Start deployment process.
@@ -51,32 +502,341 @@ class Foreman:
         :type button: kivy.uix object
         """
         logging.info(f'{__name__}: * * * * * * * * * * * * Deployment started')
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=3)
-        self.futures = [
-            self.executor.submit(Worker().deploy, device)
-            for device in devices if device['selected']
-        ]
+        selected = [device for device in devices if device['selected']]
+        try:
+            if self.fs_client is None:
+                pool_size = config.conf['concurrency']['total'] * \
+                    config.conf['download_threads']
+                self.fs_client = client.FsClient(pool_size=pool_size)
+            else:
+                self.fs_client.login()
+        except Exception as e:
+            logging.error(f'{__name__}: unable to set up file server client')
+            logging.error(str(e))
+            button.deploy_off()
+            return
+        downloads = Downloads(self.fs_client)
+        keys = {downloads.get_key(device) for device in selected}
+        logging.info(f'{__name__}: {len(keys)} package(s) for '
+                     f'{len(selected)} device(s)')
+        self.limits = Limits()
+        self.stopped = False
+        self.futures = []
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.limits.total)
+        self.executors = [self.executor]
+        if config.conf['engine'] == 'asyncio':
+            self.run_asyncio(selected, downloads)
+        elif config.conf['engine'] == 'processes':
+            self.run_processes(selected, downloads)
+        elif config.conf['engine'] == 'threads':
+            self.run_threads(selected, lambda: Worker(downloads))
+        else:
+            self.run_pipeline(selected, downloads)
+        client.cache.unpin()
+        serve.server.stop()
+        logging.info(f'{__name__}: . . . . . . . . . . . . Deployment finished')
+        button.deploy_off()
+
+    def run_threads(self, devices: list, make_worker) -> None:
+        """Deploy devices in executor's threads.
+
+        :param devices: devices to be processed
+        :type devices: list
+
+        :param make_worker: callable returning new worker
+        :type make_worker: Callable[[], Worker]
+        """
+        pending = devices[:]
+        with self.cond:
+            while pending and not self.stopped:
+                device = next(
+                    (d for d in pending if self.limits.fits(d)), None)
+                if device is None:
+                    self.cond.wait()
+                    continue
+                pending.remove(device)
+                self.limits.take(device)
+                future = self.executor.submit(make_worker().deploy, device)
+                future.add_done_callback(
+                    functools.partial(self.on_done, device))
+                self.futures.append(future)
         concurrent.futures.wait(
             self.futures,
             timeout=None,
             return_when=concurrent.futures.ALL_COMPLETED
         )
-        logging.info(f'{__name__}: . . . . . . . . . . . . Deployment finished')
-        button.deploy_off()
+
+    def run_pipeline(self, devices: list, downloads: Downloads) -> None:
+        """Deploy devices through a pipeline: packages are fetched by one
+        pool, while devices admitted by limits pass connect, transfer and
+        install stages, each with its own pool, so phases of different
+        devices overlap. Connection and clean-up do not wait for the
+        package, only transfer does (with tee_stream, until its download
+        starts). Stage queues are bounded by limits, as only admitted
+        devices enter them.
+
+        :param devices: devices to be processed
+        :type devices: list
+
+        :param downloads: packages of current deployment run
+        :type downloads: Downloads
+        """
+        fetch = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.limits.get_workers('fetch'))
+        self.stages = {
+            name: concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.limits.get_workers(name))
+            for name in Job.STAGES
+        }
+        self.executors += [fetch, *self.stages.values()]
+        fetched = {}
+        for device in devices:
+            key = downloads.get_key(device)
+            if key not in fetched:
+                future = fetch.submit(downloads.get_package, device)
+                self.futures.append(future)
+                fetched[key] = future
+                if config.conf['tee_stream']:
+                    fetched[key] = downloads.get_started(device)
+                    future.add_done_callback(functools.partial(
+                        self.on_fetch_done, fetched[key]))
+        pending = devices[:]
+        self.remaining = len(devices)
+        with self.cond:
+            while pending and not self.stopped:
+                device = next(
+                    (d for d in pending if self.limits.fits(d)), None)
+                if device is None:
+                    self.cond.wait()
+                    continue
+                pending.remove(device)
+                try:
+                    job = Job(device, fetched[downloads.get_key(device)])
+                except Exception as e:
+                    logging.error(f'{device["name"]}: {str(e)}')
+                    self.remaining -= 1
+                    continue
+                self.limits.take(device)
+                self.submit_stage(job, 0)
+            # jobs finish through finish_job() even if cancelled, whereas
+            # cancelled futures do not wake concurrent.futures.wait()
+            self.remaining -= len(pending)
+            while self.remaining:
+                self.cond.wait()
+        for executor in [fetch, *self.stages.values()]:
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def on_fetch_done(started: concurrent.futures.Future, future) -> None:
+        """Cancel start of a download whose fetch was cancelled by
+        stop_deploy() before it ran, so that no job waits for it.
+
+        :param started: future set once download starts
+        :type started: concurrent.futures.Future
+
+        :param future: fetch of the package
+        :type future: concurrent.futures.Future
+        """
+        if future.cancelled():
+            started.cancel()
+
+    def submit_stage(self, job: Job, index: int) -> None:
+        """Pass a job to a pipeline stage.
+
+        :param job: deployment of a device
+        :type job: Job
+
+        :param index: index of stage in Job.STAGES
+        :type index: int
+        """
+        try:
+            future = self.stages[Job.STAGES[index]].submit(
+                self.run_stage, job, index)
+        except RuntimeError:
+            # executor is shut down by stop_deploy()
+            self.finish_job(job, False)
+            return
+        future.add_done_callback(functools.partial(self.on_cancelled, job))
+        self.futures.append(future)
+
+    def on_cancelled(self, job: Job, future) -> None:
+        """Finish a job whose stage was cancelled by stop_deploy() before
+        it started.
+
+        :param job: deployment of a device
+        :type job: Job
+
+        :param future: stage of the job
+        :type future: concurrent.futures.Future
+        """
+        if future.cancelled():
+            self.finish_job(job, False)
+
+    def run_stage(self, job: Job, index: int) -> None:
+        """Run a stage of a job and pass the job on to the next one.
+
+        :param job: deployment of a device
+        :type job: Job
+
+        :param index: index of stage in Job.STAGES
+        :type index: int
+        """
+        result = False
+        try:
+            result = not self.stopped and getattr(job, Job.STAGES[index])()
+        except Exception as e:
+            job.printl(str(e))
+        finally:
+            # SystemExit injected by stop_deploy() must release the job too
+            if result and index + 1 < len(Job.STAGES):
+                self.submit_stage(job, index + 1)
+            else:
+                self.finish_job(job, result)
+
+    def finish_job(self, job: Job, result: bool) -> None:
+        """Finish a job and release its limits.
+
+        :param job: deployment of a device
+        :type job: Job
+
+        :param result: True if all stages succeeded
+        :type result: bool
+        """
+        try:
+            job.finish(result)
+        finally:
+            with self.cond:
+                self.limits.free(job.device)
+                self.remaining -= 1
+                self.cond.notify_all()
+
+    def run_processes(self, devices: list, downloads: Downloads) -> None:
+        """Deploy devices in child processes. Packages are downloaded by
+        executor's threads, which then wait for their child processes;
+        log records of children are passed to the root logger.
+
+        :param devices: devices to be processed
+        :type devices: list
+
+        :param downloads: packages of current deployment run
+        :type downloads: Downloads
+        """
+        os.environ['KIVY_NO_ARGS'] = '1'
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        listener = logging.handlers.QueueListener(queue, LogForwarder())
+        listener.start()
+        try:
+            self.run_threads(devices, lambda: IsolatedWorker(
+                downloads, context, queue, self.processes))
+        finally:
+            listener.stop()
+
+    def run_asyncio(self, devices: list, downloads: Downloads) -> None:
+        """Deploy devices as asyncio tasks in one event loop; blocking
+        drivers' calls are offloaded to executor.
+
+        :param devices: devices to be processed
+        :type devices: list
+
+        :param downloads: packages of current deployment run
+        :type downloads: Downloads
+        """
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.set_default_executor(self.executor)
+        self.task = self.loop.create_task(self.arun(devices, downloads))
+        try:
+            self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            self.loop.run_until_complete(asyncio.gather(
+                *asyncio.all_tasks(self.loop), return_exceptions=True))
+        finally:
+            asyncio.set_event_loop(None)
+            self.loop.close()
+            self.loop = None
+            self.task = None
+
+    async def arun(self, devices: list, downloads: Downloads) -> None:
+        """Main task of asyncio engine.
+
+        :param devices: devices to be processed
+        :type devices: list
+
+        :param downloads: packages of current deployment run
+        :type downloads: Downloads
+        """
+        freed = asyncio.Event()
+
+        async def deploy(device: dict):
+            try:
+                await Worker(downloads).adeploy(device)
+            finally:
+                self.limits.free(device)
+                freed.set()
+
+        tasks = []
+        pending = devices[:]
+        while pending:
+            device = next((d for d in pending if self.limits.fits(d)), None)
+            if device is None:
+                freed.clear()
+                await freed.wait()
+                continue
+            pending.remove(device)
+            self.limits.take(device)
+            tasks.append(asyncio.create_task(deploy(device)))
+        await asyncio.gather(*tasks)
+
+    def cancel_task(self) -> None:
+        """Cancel main task of asyncio engine together with all deployments
+        (called in event loop). Deployments are cancelled one by one, as the
+        main task may be waiting for limits rather than for them.
+        """
+        if self.task:
+            for task in asyncio.all_tasks(self.loop):
+                task.cancel()
+
+    def on_done(self, device: dict, _) -> None:
+        """Release limits taken by a finished deployment.
+
+        :param device: device's params
+        :type device: dict
+        """
+        with self.cond:
+            self.limits.free(device)
+            self.cond.notify_all()
 
     def stop_deploy(self):
         """Interrupt deployment process.
         """
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        # run_asyncio() may close the loop and drop it meanwhile
+        loop = self.loop
+        if loop:
+            try:
+                loop.call_soon_threadsafe(self.cancel_task)
+            except RuntimeError:
+                pass
+        for process in self.processes[:]:
+            logging.info(f'Kill {process.name}')
+            if not drivers.kill_tree(process.pid):
+                # child has not become a session leader yet
+                process.kill()
         for future in self.futures:
             logging.info(f'Cancel {str(future)}')
             future.cancel()
         version = platform.python_version_tuple()
         major = int(version[0])
         minor = int(version[1])
-        if major > 3 or (major == 3 and minor > 8):
-            self.executor.shutdown(wait=False, cancel_futures=True)
-        else:
-            self.executor.shutdown(wait=False)
+        for executor in self.executors:
+            if major > 3 or (major == 3 and minor > 8):
+                executor.shutdown(wait=False, cancel_futures=True)
+            else:
+                executor.shutdown(wait=False)
         for t in threading.enumerate():
             if 'Executor' in t.name:
                 ctypes.pythonapi.PyThreadState_SetAsyncExc(
@@ -1,10 +1,22 @@
 from typing import Union, Any
 import subprocess
+import asyncio
 import os
+import json
+import time
+import signal
+import hashlib
+import threading
+import concurrent.futures
 import abc
+import re
+import shlex
 import shutil
+import io
+import tarfile
 import zipfile
 
+import yaml
 import smbclient.shutil
 
 from ppadb.client import Client as AdbClient
@@ -12,26 +24,78 @@ from ppadb import InstallError
 import paramiko
 import docker
 
-from utils import log, pwd
+from utils import log, pwd, checksum, stream, serve
 import config
 
 
+def get_host(device: dict) -> str:
+    """Get host a device is deployed through: device's host or server of
+    its SMB upload_dir.
+
+    :param device: device's params
+    :type device: dict
+
+    :return: host name or address ('' if unknown)
+    :rtype: str
+    """
+    if device.get('host'):
+        return device['host']
+    match = re.match(r'^\\\\([^\\]+)', device.get('upload_dir', ''))
+    return match.group(1) if match else ''
+
+
+def kill_tree(pid: int) -> bool:
+    """Kill process together with its children. On *nix the process must be
+    a session leader (started with start_new_session=True).
+
+    :param pid: process ID
+    :type pid: int
+
+    :return: False if there is no such process (group)
+    :rtype: bool
+    """
+    try:
+        if os.name == 'nt':
+            return not subprocess.run(f'taskkill /T /F /PID {pid}',
+                                      stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.DEVNULL).returncode
+        os.killpg(pid, signal.SIGKILL)
+        return True
+    except ProcessLookupError:
+        return False
+
+
 class Driver(log.Logger):
     """Common driver class.
 
     :ivar device: dict with device's data
     :ivar package: str with package's file name
+    :ivar path: str with full path to local copy of package
     :ivar client: client to interact with device
     :ivar obj: device's object
     :ivar dest: destination (working) directory/path
+    :ivar growing: stream.GrowingFile of package while it is being
+                   downloaded (tee_stream) or None
     """
+    COPY_CHUNK = 1024 * 1024
+
     def __init__(self, device: dict, package: str):
         super().__init__()
         self.device = device
-        self.package = package
+        self.set_package(package)
         self.client = None
         self.obj = None
         self.dest = self.device['upload_dir']
+        self.growing = None
+
+    def set_package(self, package: str) -> None:
+        """Set package to deploy.
+
+        :param package: package's path relative to download_dir
+        :type package: str
+        """
+        self.package = os.path.basename(package)
+        self.path = os.path.join(config.conf['download_dir'], package)
 
     @abc.abstractmethod
     def connect(self) -> Union[Any, None]:
@@ -54,6 +118,16 @@ class Driver(log.Logger):
         """
         pass
 
+    def transfer(self) -> bool:
+        """Transfer package to remote device. Only moves data and does not
+        touch running application, so it may overlap with other devices'
+        installation; drivers which push packages override it.
+
+        :return: True on success and False on failure
+        :rtype: bool
+        """
+        return True
+
     @abc.abstractmethod
     def install(self) -> bool:
         """Install package to specified device.
@@ -63,21 +137,180 @@ class Driver(log.Logger):
         """
         pass
 
+    def disconnect(self) -> None:
+        """Release connection to remote device.
+        """
+        pass
+
+    def can_stream(self) -> bool:
+        """Check if driver can push package to device while it is being
+        downloaded; drivers which read it as a whole (e.g. as an archive)
+        get it only when the download is complete.
+
+        :return: True if transfer may start before download completes
+        :rtype: bool
+        """
+        return False
+
+    def is_growing(self) -> bool:
+        """Check if package is still being downloaded.
+
+        :return: True if package must be read through self.growing
+        :rtype: bool
+        """
+        return self.growing is not None and not self.growing.finished
+
+    def wait_package(self) -> None:
+        """Wait until package is downloaded unless driver can stream it.
+        """
+        if self.growing is not None and not self.can_stream():
+            self.growing.wait()
+
+    def is_staged(self, size: int, mtime: float, get_hash) -> bool:
+        """Check if remote copy of package is identical to local one: sizes
+        must match, then either modification times or SHA-256 hashes.
+
+        :param size: size of remote copy
+        :type size: int
+
+        :param mtime: modification time of remote copy
+        :type mtime: float
+
+        :param get_hash: callable returning SHA-256 hex digest of remote copy
+                         or None if it is unavailable
+        :type get_hash: Callable
+
+        :return: True if remote copy is identical
+        :rtype: bool
+        """
+        stat = os.stat(self.path)
+        if size != stat.st_size:
+            return False
+        if int(mtime) == int(stat.st_mtime):
+            return True
+        digest = get_hash()
+        return bool(digest) and \
+            digest.lower() == checksum.file_hash.get_hash(self.path)
+
+    @staticmethod
+    def smb_hash(remote: str) -> str:
+        """Get SHA-256 hash of a remote file read over SMB.
+
+        :param remote: remote path (UNC)
+        :type remote: str
+
+        :return: hex digest
+        :rtype: str
+        """
+        with smbclient.open_file(remote, mode='rb') as f:
+            return checksum.file_hash.get_stream_hash(f)
+
+    def smb_stage(self, remote: str, get_hash=None) -> None:
+        """Copy package over SMB unless identical copy is already there.
+        Package which is still being downloaded is streamed as it grows.
+        Modification time of the copy is set to local one, so that next
+        check does not need hashing.
+
+        :param remote: remote path (UNC)
+        :type remote: str
+
+        :param get_hash: callable returning SHA-256 hex digest of remote copy
+                         (hash of data read over SMB by default)
+        :type get_hash: Callable
+        """
+        stat = None
+        if not self.is_growing():
+            try:
+                stat = smbclient.stat(remote)
+            except OSError:
+                pass
+        if stat and self.is_staged(
+                stat.st_size, stat.st_mtime,
+                get_hash or (lambda: self.smb_hash(remote))):
+            self.printl(f'{remote} is up to date, skipping upload')
+        elif self.is_growing():
+            self.printl(f'streaming {self.package} to {remote} ...')
+            with self.growing.open() as f, \
+                    smbclient.open_file(remote, mode='wb') as rf:
+                shutil.copyfileobj(f, rf, self.COPY_CHUNK)
+            self.printl('done')
+        else:
+            self.printl(f'copying {self.package} to {remote} ...')
+            smbclient.shutil.copy(self.path, remote)
+            self.printl('done')
+        mtime = os.stat(self.path).st_mtime
+        smbclient.utime(remote, times=(mtime, mtime))
+
     def deploy(self) -> bool:
         """Deploy package to specified device:
         1. Connect to device.
         2. Perform clean-up procedure.
-        2. Install specified package to connected device.
+        3. Transfer package to device.
+        4. Install specified package to connected device.
+        5. Release connection.
 
         :return: True on success and False on failure
         :rtype: bool
         """
         result = False
-        if self.connect():
-            if self.device['cleanup']:
-                self.cleanup()
-            if self.install():
-                result = True
+        try:
+            if self.connect():
+                if self.device['cleanup']:
+                    self.cleanup()
+                self.wait_package()
+                if self.transfer() and self.install():
+                    result = True
+        finally:
+            self.disconnect()
+        if result:
+            self.printl('+ + + + + + Deployment succeeded')
+        else:
+            self.printl('! ! ! ! ! ! Deployment failed')
+        return result
+
+    async def aconnect(self) -> Union[Any, None]:
+        """Coroutine version of :meth:`connect`; runs it in executor unless
+        a driver provides a native implementation.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.connect)
+
+    async def acleanup(self) -> bool:
+        """Coroutine version of :meth:`cleanup`.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.cleanup)
+
+    async def atransfer(self) -> bool:
+        """Coroutine version of :meth:`transfer`.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.transfer)
+
+    async def ainstall(self) -> bool:
+        """Coroutine version of :meth:`install`.
+        """
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.install)
+
+    async def adeploy(self) -> bool:
+        """Coroutine version of :meth:`deploy`.
+
+        :return: True on success and False on failure
+        :rtype: bool
+        """
+        result = False
+        try:
+            if await self.aconnect():
+                if self.device['cleanup']:
+                    await self.acleanup()
+                if self.growing is not None:
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self.wait_package)
+                if await self.atransfer() and await self.ainstall():
+                    result = True
+        finally:
+            self.disconnect()
         if result:
             self.printl('+ + + + + + Deployment succeeded')
         else:
@@ -100,23 +333,293 @@ class Driver(log.Logger):
             **kwargs
         )
 
+    @staticmethod
+    async def arun_proc(cmd: str) -> subprocess.CompletedProcess:
+        """Run shell subprocess without blocking event loop. Subprocess is
+        killed if the coroutine is cancelled.
+
+        :param cmd: shell command
+        :type cmd: str
+
+        :return: object of completed process
+        :rtype: subprocess.CompletedProcess
+        """
+        creation = asyncio.ensure_future(asyncio.create_subprocess_shell(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            start_new_session=os.name != 'nt'
+        ))
+        proc = None
+        try:
+            proc = await asyncio.shield(creation)
+            stdout, stderr = await proc.communicate()
+        except asyncio.CancelledError:
+            if proc is None:
+                proc = await creation
+            kill_tree(proc.pid)
+            # reap it before the loop is closed
+            await proc.wait()
+            raise
+        return subprocess.CompletedProcess(
+            cmd, proc.returncode, stdout.decode(), stderr.decode())
+
+
+class SshPool:
+    """Process-wide pool of authenticated SSH connections keyed by
+    (host, port, username).
+
+    Connections are reused across deployments, kept alive with SSH
+    keep-alive messages and closed when broken or idle for longer than
+    ssh_idle_timeout seconds.
+
+    :ivar lock: lock guarding clients
+    :ivar clients: dict key -> {'client', 'used', 'users'}
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = {}
+
+    @staticmethod
+    def is_active(client: paramiko.SSHClient) -> bool:
+        transport = client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def evict(self) -> None:
+        """Close broken connections and idle ones nobody uses.
+        """
+        now = time.time()
+        with self.lock:
+            for key, entry in list(self.clients.items()):
+                if entry['users']:
+                    continue
+                if not self.is_active(entry['client']) or \
+                        now - entry['used'] > config.conf['ssh_idle_timeout']:
+                    entry['client'].close()
+                    del self.clients[key]
+
+    def acquire(self, host: str, port: int,
+                username: str) -> paramiko.SSHClient:
+        """Get connected client, connect if there is no usable one.
+
+        :param host: remote host
+        :type host: str
+
+        :param port: SSH port
+        :type port: int
+
+        :param username: user name
+        :type username: str
+
+        :return: connected client
+        :rtype: paramiko.SSHClient
+        """
+        self.evict()
+        key = (host, port, username)
+        with self.lock:
+            entry = self.clients.get(key)
+            if entry and self.is_active(entry['client']):
+                entry['users'] += 1
+                entry['used'] = time.time()
+                return entry['client']
+
+        client = paramiko.SSHClient()
+        client.load_system_host_keys()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(
+            hostname=host,
+            port=port,
+            username=username,
+            password=pwd.UserPassword().get_password(username)
+        )
+        client.get_transport().set_keepalive(config.conf['ssh_keepalive'])
+        with self.lock:
+            entry = self.clients.get(key)
+            if entry and self.is_active(entry['client']):
+                client.close()
+                entry['users'] += 1
+            else:
+                entry = {'client': client, 'users': 1}
+                self.clients[key] = entry
+            entry['used'] = time.time()
+            return entry['client']
+
+    def release(self, client: paramiko.SSHClient) -> None:
+        """Return client to pool.
+
+        :param client: client got from :meth:`acquire`
+        :type client: paramiko.SSHClient
+        """
+        with self.lock:
+            for entry in self.clients.values():
+                if entry['client'] is client:
+                    entry['users'] -= 1
+                    entry['used'] = time.time()
+
+    def close(self) -> None:
+        """Close all connections.
+        """
+        with self.lock:
+            for entry in self.clients.values():
+                entry['client'].close()
+            self.clients.clear()
+
+
+ssh_pool = SshPool()
+
+
+class SmbSessions:
+    """Process-wide registry of SMB sessions keyed by (server, username).
+
+    Session is negotiated once and shared by all deployments through the
+    same server; tree connects are cached by smbclient within the session.
+    Concurrent deployments to one server wait for a single negotiation.
+
+    :ivar lock: lock guarding locks and sessions
+    :ivar locks: dict key -> lock serialising registration
+    :ivar sessions: dict key -> smbprotocol session
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.locks = {}
+        self.sessions = {}
+
+    def register(self, server: str, username: str = None,
+                 password: str = None, **kwargs):
+        """Get session with a server, register it if there is none.
+
+        :param server: server name or address
+        :type server: str
+
+        :param username: user name (None for guest/implicit credentials)
+        :type username: str
+
+        :param password: password
+        :type password: str
+
+        :return: SMB session
+        """
+        key = (server.lower(), username)
+        with self.lock:
+            lock = self.locks.setdefault(key, threading.Lock())
+        with lock:
+            with self.lock:
+                if key in self.sessions:
+                    return self.sessions[key]
+            session = smbclient.register_session(
+                server, username=username, password=password, **kwargs)
+            with self.lock:
+                self.sessions[key] = session
+            return session
+
+    def evict(self, server: str) -> None:
+        """Drop sessions with a server (e.g. broken connection) together with
+        the connection; next registration negotiates anew.
+
+        :param server: server name or address
+        :type server: str
+        """
+        with self.lock:
+            keys = [k for k in self.sessions if k[0] == server.lower()]
+            for key in keys:
+                del self.sessions[key]
+        if keys:
+            try:
+                smbclient.delete_session(server)
+            except Exception:
+                pass
+
+    def close(self) -> None:
+        """Close all sessions and connections.
+        """
+        with self.lock:
+            self.sessions.clear()
+        smbclient.reset_connection_cache()
+
+
+smb_sessions = SmbSessions()
+
+
+class WinRmPool:
+    """Process-wide pool of WinRM sessions keyed by (host, username).
+
+    A session is used by one deployment at a time; released sessions are
+    reused, so their HTTP connections and authentication survive between
+    deployments.
+
+    :ivar lock: lock guarding idle and keys
+    :ivar idle: dict key -> list of idle sessions
+    :ivar keys: dict id(session) -> key
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.keys = {}
+
+    def acquire(self, host: str, username: str):
+        """Get idle session or create a new one.
+
+        :param host: remote host
+        :type host: str
+
+        :param username: user name
+        :type username: str
+
+        :return: WinRM session
+        :rtype: winrm.Session
+        """
+        key = (host, username)
+        with self.lock:
+            if self.idle.get(key):
+                return self.idle[key].pop()
+        import winrm
+        session = winrm.Session(
+            host,
+            auth=(username, pwd.UserPassword().get_password(username))
+        )
+        with self.lock:
+            self.keys[id(session)] = key
+        return session
+
+    def release(self, session) -> None:
+        """Return session to pool.
+
+        :param session: session got from :meth:`acquire`
+        :type session: winrm.Session
+        """
+        with self.lock:
+            key = self.keys.get(id(session))
+            if key is not None:
+                self.idle.setdefault(key, []).append(session)
+
+    def close(self) -> None:
+        """Forget all sessions.
+        """
+        with self.lock:
+            self.idle.clear()
+            self.keys.clear()
+
+
+winrm_pool = WinRmPool()
+
 
 class Nix(Driver):
     """Common driver for *nix systems.
     """
+    STEP_MARK = '@@integra-step'
+    PUT_CHUNK = 1024 * 1024
+    MIN_CHANNEL_RANGE = 16 * 1024 * 1024
+    BLOCK_HASHES = (
+        'import hashlib, sys\n'
+        'with open(sys.argv[1], "rb") as f:\n'
+        '    for b in iter(lambda: f.read(int(sys.argv[2])), b""):\n'
+        '        print(hashlib.md5(b).hexdigest())'
+    )
+
     def connect(self) -> Union[Any, None]:
         self.printl(f'ssh to {self.device["host"]}:{self.device["port"]} ...')
         try:
-            self.client = paramiko.SSHClient()
-            self.client.load_system_host_keys()
-            self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            self.client.connect(
-                hostname=self.device['host'],
-                port=self.device['port'],
-                username=self.device['username'],
-                password=pwd.UserPassword().get_password(
-                    self.device['username'])
-            )
+            self.client = ssh_pool.acquire(self.device['host'],
+                                           self.device['port'],
+                                           self.device['username'])
             self.printl(f'connected')
             return self.client
         except Exception as e:
@@ -124,34 +627,306 @@ class Nix(Driver):
             self.printl(str(e))
             return None
 
+    def disconnect(self) -> None:
+        if self.client:
+            ssh_pool.release(self.client)
+            self.client = None
+
     def cleanup(self) -> bool:
         pass
 
     def install(self) -> bool:
         pass
 
+    def can_stream(self) -> bool:
+        return True
+
     def upload(self, upload_path: str) -> None:
-        """Upload package to remote host.
+        """Upload package to remote host; package which is still being
+        downloaded is streamed as it grows.
 
         :param upload_path: full path, which includes both destination dir and
                             filename
         :type upload_path: str
         """
-        self.printl(f'copying {self.package} to {upload_path} ...')
-        sftp = self.client.open_sftp()
-        sftp.put(os.path.join(config.conf['download_dir'], self.package),
-                 upload_path)
-        sftp.close()
-        self.printl('done')
+        sftp = self.open_sftp()
+        try:
+            stat = None
+            if not self.is_growing():
+                try:
+                    stat = sftp.stat(upload_path)
+                except IOError:
+                    pass
+            if stat and self.is_staged(stat.st_size, stat.st_mtime,
+                                       lambda: self.get_hash(upload_path)):
+                self.printl(f'{upload_path} is up to date, skipping upload')
+            elif self.is_growing():
+                self.printl(f'streaming {self.package} to {upload_path} ...')
+                self.put_growing(sftp, upload_path)
+                self.printl('done')
+            else:
+                self.printl(f'copying {self.package} to {upload_path} ...')
+                if not self.upload_delta(sftp, upload_path):
+                    self.put(sftp, self.path, upload_path)
+                self.printl('done')
+            mtime = os.stat(self.path).st_mtime
+            sftp.utime(upload_path, (mtime, mtime))
+        finally:
+            sftp.close()
+
+    def get_hash(self, path: str) -> Union[str, None]:
+        """Get SHA-256 hash of a remote file (computed on the remote host).
+
+        :param path: remote file
+        :type path: str
+
+        :return: hex digest or None if unavailable
+        :rtype: Union[str, None]
+        """
+        quoted = shlex.quote(path)
+        _, stdout, _ = self.client.exec_command(
+            f'sha256sum {quoted} 2>/dev/null || shasum -a 256 {quoted}')
+        output = stdout.read().decode().split()
+        if stdout.channel.recv_exit_status() or not output:
+            return None
+        return output[0]
+
+    def open_sftp(self) -> paramiko.SFTPClient:
+        """Open SFTP session with large window, so that many pipelined write
+        requests stay in flight.
+
+        :return: SFTP client
+        :rtype: paramiko.SFTPClient
+        """
+        return paramiko.SFTPClient.from_transport(
+            self.client.get_transport(),
+            window_size=config.conf['sftp_window_size']
+        )
+
+    def put_range(self, local: str, remote: str, start: int, end: int,
+                  sftp: paramiko.SFTPClient = None) -> None:
+        """Write a byte range of local file into existing remote file with
+        pipelined requests.
+
+        :param local: local file
+        :type local: str
+
+        :param remote: remote file
+        :type remote: str
+
+        :param start: first byte
+        :type start: int
+
+        :param end: end of range (exclusive)
+        :type end: int
+
+        :param sftp: SFTP client (a new one is opened if None)
+        :type sftp: paramiko.SFTPClient
+        """
+        own = sftp is None
+        if own:
+            sftp = self.open_sftp()
+        try:
+            with open(local, 'rb') as f, sftp.open(remote, 'r+b') as rf:
+                rf.set_pipelined(True)
+                f.seek(start)
+                rf.seek(start)
+                while start < end:
+                    data = f.read(min(self.PUT_CHUNK, end - start))
+                    rf.write(data)
+                    start += len(data)
+        finally:
+            if own:
+                sftp.close()
+
+    def put(self, sftp: paramiko.SFTPClient, local: str, remote: str) -> None:
+        """Upload file. Large files are split into sftp_channels ranges
+        written concurrently through separate SFTP channels. Throughput is
+        logged.
+
+        :param sftp: SFTP client
+        :type sftp: paramiko.SFTPClient
+
+        :param local: local file
+        :type local: str
+
+        :param remote: remote file
+        :type remote: str
+        """
+        started = time.time()
+        size = os.path.getsize(local)
+        with sftp.open(remote, 'wb') as rf:
+            rf.truncate(size)
+        channels = max(1, min(config.conf['sftp_channels'],
+                              size // self.MIN_CHANNEL_RANGE))
+        step = -(-size // channels) if size else 0
+        if channels == 1:
+            self.put_range(local, remote, 0, size, sftp)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(channels) as executor:
+                futures = [
+                    executor.submit(self.put_range, local, remote,
+                                    start, min(start + step, size))
+                    for start in range(0, size, step)
+                ]
+                for future in futures:
+                    future.result()
+        self.print_rate(size, started)
+
+    def put_growing(self, sftp: paramiko.SFTPClient, remote: str) -> None:
+        """Upload package while it is being downloaded: data is written
+        with pipelined requests as soon as it is on local disk, so the
+        upload trails the download. Throughput is logged.
+
+        :param sftp: SFTP client
+        :type sftp: paramiko.SFTPClient
+
+        :param remote: remote file
+        :type remote: str
+        """
+        started = time.time()
+        size = 0
+        with self.growing.open() as f, sftp.open(remote, 'wb') as rf:
+            rf.set_pipelined(True)
+            for data in iter(lambda: f.read(self.PUT_CHUNK), b''):
+                rf.write(data)
+                size += len(data)
+        self.print_rate(size, started)
+
+    def print_rate(self, size: int, started: float) -> None:
+        """Log upload throughput.
+
+        :param size: uploaded bytes
+        :type size: int
+
+        :param started: time upload started at
+        :type started: float
+        """
+        elapsed = max(time.time() - started, 0.001)
+        mb = size / 1024 / 1024
+        self.printl(
+            f'{mb:.1f} MB in {elapsed:.1f} s ({mb / elapsed:.1f} MB/s)')
+
+    def get_block_hashes(self, path: str) -> Union[list, None]:
+        """Get MD5 hashes of fixed-size blocks of a remote file (computed on
+        the remote host by python3).
+
+        :param path: remote file
+        :type path: str
+
+        :return: list of hex digests or None if unavailable
+        :rtype: Union[list, None]
+        """
+        _, stdout, _ = self.client.exec_command(
+            f"python3 -c '{self.BLOCK_HASHES}' {shlex.quote(path)} "
+            f"{config.conf['delta_block_size']}"
+        )
+        hashes = stdout.read().decode().split()
+        if stdout.channel.recv_exit_status():
+            return None
+        return hashes
+
+    def get_delta_base(self, sftp: paramiko.SFTPClient,
+                       upload_path: str) -> Union[str, None]:
+        """Find previous remote copy of package: the file itself or, as new
+        builds have new names, the newest file matching ptype's mask in the
+        same directory.
+
+        :param sftp: SFTP client
+        :type sftp: paramiko.SFTPClient
+
+        :param upload_path: full path, which includes both destination dir and
+                            filename
+        :type upload_path: str
+
+        :return: remote path or None if there is no previous copy
+        :rtype: Union[str, None]
+        """
+        try:
+            sftp.stat(upload_path)
+            return upload_path
+        except IOError:
+            pass
+        dest = upload_path.rsplit('/', 1)[0]
+        mask = config.conf['ptypes'][self.device['ptype']]['mask']
+        try:
+            found = [a for a in sftp.listdir_attr(dest)
+                     if mask in a.filename and
+                     not a.filename.endswith('.integra')]
+        except IOError:
+            return None
+        if not found:
+            return None
+        newest = max(found, key=lambda a: a.st_mtime)
+        return f'{dest}/{newest.filename}'
+
+    def upload_delta(self, sftp: paramiko.SFTPClient,
+                     upload_path: str) -> bool:
+        """Upload package by sending only blocks which differ from previous
+        remote copy (see :meth:`get_delta_base`): the copy is duplicated on
+        the remote host, changed blocks are written into the duplicate,
+        which then takes package's name.
+
+        :param sftp: SFTP client
+        :type sftp: paramiko.SFTPClient
+
+        :param upload_path: full path, which includes both destination dir and
+                            filename
+        :type upload_path: str
+
+        :return: True if package was uploaded, False if delta transfer is not
+                 possible or not worth it
+        :rtype: bool
+        """
+        block_size = config.conf['delta_block_size']
+        base = self.get_delta_base(sftp, upload_path)
+        if base is None:
+            return False
+        remote = self.get_block_hashes(base)
+        if remote is None:
+            return False
+        local = []
+        with open(self.path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                local.append(hashlib.md5(block).hexdigest())
+        changed = [i for i, h in enumerate(local)
+                   if i >= len(remote) or remote[i] != h]
+        if len(changed) > len(local) * config.conf['delta_max_ratio']:
+            return False
+
+        tmp = f'{upload_path}.integra'
+        _, stdout, _ = self.client.exec_command(
+            f'cp -p {shlex.quote(base)} {shlex.quote(tmp)}')
+        if stdout.channel.recv_exit_status():
+            return False
+        with open(self.path, 'rb') as f, sftp.open(tmp, 'r+b') as rf:
+            rf.set_pipelined(True)
+            for i in changed:
+                f.seek(i * block_size)
+                rf.seek(i * block_size)
+                rf.write(f.read(block_size))
+            rf.truncate(os.path.getsize(self.path))
+        if self.get_block_hashes(tmp) != local:
+            sftp.remove(tmp)
+            self.printl('delta upload verification failed')
+            return False
+        sftp.posix_rename(tmp, upload_path)
+        self.printl(f'sent {len(changed)} of {len(local)} blocks, '
+                    f'the rest taken from {base}')
+        return True
 
-    def exec(self, cmd: str, passwd: str = None) -> None:
-        """Execute one command on a server.
+    def exec(self, cmd: str, passwd: str = None) -> int:
+        """Execute one command on a server. Output is logged line by line as
+        it arrives.
 
         :param cmd: shell command
         :type cmd: str
 
         :param passwd: password for sudo (None by default)
         :type passwd: str
+
+        :return: exit status of the command
+        :rtype: int
         """
         session = self.client.get_transport().open_session()
         session.set_combine_stderr(True)
@@ -162,25 +937,131 @@ class Nix(Driver):
         if passwd:
             stdin.write(f'{passwd}\n')
             stdin.flush()
-        for r in stdout.readlines():
-            l = r.decode().rstrip('\n')
+        for r in stdout:
+            l = r.decode(errors='replace').rstrip('\r\n')
             self.printl(l)
+        status = session.recv_exit_status()
+        session.close()
+        return status
+
+    def exec_stream(self, cmd: str, write) -> int:
+        """Execute command on a server feeding binary data to its stdin.
+        No pseudo-terminal is allocated, so data passes unchanged. Output is
+        logged once input is sent.
+
+        :param cmd: shell command
+        :type cmd: str
+
+        :param write: callable writing data to given file-like object
+        :type write: Callable
+
+        :return: exit status of the command
+        :rtype: int
+        """
+        session = self.client.get_transport().open_session()
+        session.set_combine_stderr(True)
+        session.exec_command(cmd)
+        stdin = session.makefile('wb', -1)
+        stdout = session.makefile('rb', -1)
+        try:
+            write(stdin)
+            stdin.flush()
+            session.shutdown_write()
+        except OSError as e:
+            # command exited before reading all input, status tells why
+            self.printl(str(e))
+        for r in stdout:
+            self.printl(r.decode(errors='replace').rstrip('\r\n'))
+        status = session.recv_exit_status()
         session.close()
+        return status
+
+    def exec_steps(self, steps: list, passwd: str = None) -> list:
+        """Execute sequence of commands as one script in one channel.
+        Every step runs in a subshell; its exit status is reported by a
+        marker line, so output is still logged line by line. The script
+        stops at the first failed step.
+
+        :param steps: list of (title, shell command)
+        :type steps: list
+
+        :param passwd: password for sudo (None by default); is consumed by
+                       the first sudo of the script
+        :type passwd: str
+
+        :return: exit statuses of executed steps
+        :rtype: list
+        """
+        script = []
+        for i, (_, cmd) in enumerate(steps):
+            script.append(f'echo "{self.STEP_MARK} {i}"')
+            script.append(f'( {cmd} )')
+            script.append(f's=$? ; echo "{self.STEP_MARK} {i} $s" ; '
+                          f'[ $s -eq 0 ] || exit $s')
+        session = self.client.get_transport().open_session()
+        session.set_combine_stderr(True)
+        session.get_pty()
+        stdin = session.makefile('wb', -1)
+        stdout = session.makefile('rb', -1)
+        session.exec_command('\n'.join(script))
+        if passwd:
+            stdin.write(f'{passwd}\n')
+            stdin.flush()
+        statuses = []
+        for r in stdout:
+            l = r.decode(errors='replace').rstrip('\r\n')
+            if not l.startswith(self.STEP_MARK):
+                self.printl(l)
+                continue
+            marker = l.split()
+            title = steps[int(marker[1])][0]
+            if len(marker) == 2:
+                self.printl(title)
+            else:
+                statuses.append(int(marker[2]))
+                if statuses[-1]:
+                    self.printl(f'{title}: exit status {statuses[-1]}')
+        session.close()
+        return statuses
+
+    def run_steps(self, steps: list, passwd: str = None) -> bool:
+        """Execute steps with :meth:`exec_steps`.
+
+        :param steps: list of (title, shell command)
+        :type steps: list
+
+        :param passwd: password for sudo (None by default)
+        :type passwd: str
+
+        :return: True if all steps succeeded
+        :rtype: bool
+        """
+        statuses = self.exec_steps(steps, passwd)
+        return len(statuses) == len(steps) and not any(statuses)
 
 
 class Windows(Driver):
     """Driver for Windows devices.
+
+    In pull mode (windows_pull in config.yaml) the target downloads the
+    installer from Integra's HTTP server and runs it in one PowerShell
+    call; SMB is not used.
     """
+    ARGS = '/VERYSILENT /SUPPRESSMSGBOXES /NOCANCEL /CURRENTUSER' \
+           ' /LOWESTPRIVILEGES=true'
+
     def connect(self):
+        server = get_host(self.device)
         try:
-            self.printl(f'smbclient to {self.device["host"]} ...')
-            smbclient.register_session(
-                self.device['host'],
-                username=self.device['username'],
-                password=pwd.UserPassword().get_password(
-                    self.device['username'])
-            )
-            self.printl('connected')
+            if not config.conf['windows_pull']:
+                self.printl(f'smbclient to {server} ...')
+                smb_sessions.register(
+                    server,
+                    username=self.device['username'],
+                    password=pwd.UserPassword().get_password(
+                        self.device['username'])
+                )
+                self.printl('connected')
             # import wmi
             # self.printl(f'wmi to {self.device["host"]} ...')
             # self.client = wmi.WMI(
@@ -191,50 +1072,105 @@ class Windows(Driver):
             # )
             # self.printl(f'connected to '
             #             f'{self.client.Win32_OperatingSystem()[0].Caption}')
-            import winrm
             self.printl(f'winrm to {self.device["host"]} ...')
-            self.client = winrm.Session(
-                self.device['host'],
-                auth=(
-                    self.device['username'],
-                    pwd.UserPassword().get_password(self.device['username'])
-                )
-            )
+            self.client = winrm_pool.acquire(self.device['host'],
+                                             self.device['username'])
             self.printl('connected')
         except Exception as e:
             self.printl('unable to connect')
             self.printl(str(e))
             return None
 
-        if not smbclient.path.isdir(self.dest):
-            self.printl(f'{self.dest} does not exist')
+        if config.conf['windows_pull']:
+            return self.client
+        try:
+            if not smbclient.path.isdir(self.dest):
+                self.printl(f'{self.dest} does not exist')
+                return None
+        except Exception as e:
+            smb_sessions.evict(server)
+            self.printl(str(e))
             return None
         return self.client
 
+    def disconnect(self) -> None:
+        if self.client:
+            winrm_pool.release(self.client)
+            self.client = None
+
     def cleanup(self) -> bool:
         # TODO: uninstall previous version
         # TODO: remove residual data
         return True
 
-    def install(self) -> bool:
+    def get_hash(self) -> Union[str, None]:
+        """Get SHA-256 hash of uploaded package with Get-FileHash on the
+        target, fall back to reading it over SMB.
+
+        :return: hex digest or None if unavailable
+        :rtype: Union[str, None]
+        """
+        remote = f'{self.dest}\\{self.package}'
+        result = self.client.run_ps(
+            f"(Get-FileHash -Algorithm SHA256 -LiteralPath '{remote}').Hash")
+        digest = result.std_out.decode().strip()
+        if result.status_code or not digest:
+            return self.smb_hash(remote)
+        return digest
+
+    def install_pull(self) -> bool:
+        """Let the target download the installer over HTTP (unless an
+        identical copy is already in its temp directory) and run it, all
+        in one PowerShell call.
+
+        :return: True on success and False on failure
+        :rtype: bool
+        """
+        url = serve.server.get_url(self.path, config.conf['serve_port'],
+                                   self.device['host'])
+        digest = checksum.file_hash.get_hash(self.path)
+        self.printl(f'installing {self.package} from {url} ...')
+        result = self.client.run_ps(
+            f"$ProgressPreference = 'SilentlyContinue'\n"
+            f"$p = Join-Path $env:TEMP '{self.package}'\n"
+            f"if (-not (Test-Path $p) -or "
+            f"(Get-FileHash -Algorithm SHA256 $p).Hash -ne '{digest}') {{\n"
+            f"    Invoke-WebRequest -Uri '{url}' -OutFile $p "
+            f"-UseBasicParsing\n"
+            f"}}\n"
+            f"$r = Start-Process -FilePath $p -ArgumentList '{self.ARGS}' "
+            f"-Wait -PassThru\n"
+            f"exit $r.ExitCode"
+        )
+        if result.status_code:
+            self.printl(f'something went wrong, rvalue={result.status_code}')
+            self.printl(result.std_err.decode(errors='replace'))
+            return False
+        self.printl('installation finished')
+        return True
+
+    def can_stream(self) -> bool:
+        return not config.conf['windows_pull']
+
+    def transfer(self) -> bool:
+        if config.conf['windows_pull']:
+            return True
         try:
-            self.printl(f'uploading {self.package} to {self.dest} ...')
-            smbclient.shutil.copy(
-                os.path.join(config.conf['download_dir'], self.package),
-                self.dest
-            )
-            self.printl('done')
+            self.smb_stage(f'{self.dest}\\{self.package}', self.get_hash)
         except Exception as e:
             self.printl('uploading failed')
             self.printl(str(e))
             return False
+        return True
+
+    def install(self) -> bool:
+        if config.conf['windows_pull']:
+            return self.install_pull()
 
         package = os.path.join(self.dest, os.sep, self.package)
-        cmd = '/VERYSILENT /SUPPRESSMSGBOXES /NOCANCEL /CURRENTUSER' \
-              ' /LOWESTPRIVILEGES=true'
         self.printl(f'installing {self.package} ...')
         # _, rvalue = self.obj.Win32_Process.Create(CommandLine=cmd)
-        result = self.client.run_cmd(package, cmd.split(' '))
+        result = self.client.run_cmd(package, self.ARGS.split(' '))
         rvalue = result.status_code
 
         if rvalue:
@@ -245,79 +1181,262 @@ class Windows(Driver):
         return True
 
 
+APKS_LOCK = threading.Lock()
+APKS_LOCKS = {}
+
+
+class AdbManager:
+    """Process-wide client of ADB server with pool of connected devices.
+
+    ADB server is started once; device handles are kept between
+    deployments and reused while the device is still online.
+
+    :ivar lock: lock guarding client and devices
+    :ivar client: ADB client
+    :ivar devices: dict serial -> device handle
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.client = None
+        self.devices = {}
+
+    def get_client(self) -> AdbClient:
+        """Get ADB client, start ADB server if needed.
+
+        :return: ADB client
+        :rtype: AdbClient
+        """
+        with self.lock:
+            if self.client is None:
+                Driver.run_proc('adb start-server')
+                self.client = AdbClient(host='127.0.0.1', port=5037)
+            return self.client
+
+    @staticmethod
+    def is_online(device) -> bool:
+        """Check if device handle is still usable.
+
+        :param device: device handle
+
+        :return: True if device is online
+        :rtype: bool
+        """
+        try:
+            return device.get_state() == 'device'
+        except Exception:
+            return False
+
+    def get_device(self, host: str, port: int):
+        """Get handle of connected device, connect if needed.
+
+        :param host: device's host
+        :type host: str
+
+        :param port: device's port
+        :type port: int
+
+        :return: device handle or None if unable to connect
+        """
+        serial = f'{host}:{port}'
+        with self.lock:
+            device = self.devices.get(serial)
+        if device is not None and self.is_online(device):
+            return device
+        try:
+            client = self.get_client()
+            connected = client.remote_connect(host, port)
+        except Exception:
+            with self.lock:
+                self.client = None
+            client = self.get_client()
+            connected = client.remote_connect(host, port)
+        if not connected:
+            return None
+        device = client.device(serial)
+        with self.lock:
+            self.devices[serial] = device
+        return device
+
+
+adb = AdbManager()
+
+
 class Android(Driver):
     """Driver for Android devices.
     """
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.run_proc('adb start-server')
-        self.client = AdbClient(host='127.0.0.1', port=5037)
-
     def connect(self):
         self.printl(f'adb to {self.device["host"]}:{self.device["port"]} ... ')
-        if self.client.remote_connect(
-                self.device['host'], self.device['port']):
-            self.printl('connected')
-        else:
+        self.obj = adb.get_device(self.device['host'], self.device['port'])
+        if self.obj is None:
             self.printl('unable to connect')
             return None
-        self.obj = \
-            self.client.device(f'{self.device["host"]}:{self.device["port"]}')
+        self.printl('connected')
+        self.client = adb.client
         return self.obj
 
     def cleanup(self) -> bool:
         self.obj.uninstall(config.conf['editions'][self.device['edition']])
         return True
 
-    def install(self) -> bool:
+    def can_stream(self) -> bool:
+        return 'aab' not in self.device['ptype']
+
+    def install_growing(self) -> None:
+        """Install APK while it is being downloaded: data is streamed into
+        ``cmd package install`` through ADB connection as soon as it is on
+        local disk, no copy is pushed to device storage first.
+        """
+        size = self.growing.get_size()
+        conn = self.obj.create_connection()
+        try:
+            conn.send(f'exec:cmd package install -r -d -S {size}')
+            with self.growing.open() as f:
+                for data in iter(lambda: f.read(self.COPY_CHUNK), b''):
+                    if f.offset >= size:
+                        # device installs once it has all the bytes, so
+                        # the last ones wait for download verification
+                        self.growing.wait()
+                    conn.socket.sendall(data)
+            output = conn.read_all().decode(errors='replace').strip()
+        finally:
+            conn.close()
+        if 'Success' not in output:
+            raise InstallError(self.package, output)
+
+    async def aget_device_spec(self, bundletool: str) -> str:
+        """Get device spec (ABIs, screen density, SDK version, locales, etc.)
+        of connected device.
+
+        :param bundletool: path to bundletool.jar
+        :type bundletool: str
+
+        :return: path to JSON file with device spec
+        :rtype: str
+        """
+        serial = re.sub(r'[^\w.-]', '_', self.obj.serial)
+        spec = os.path.join(os.path.dirname(self.path), 'apks',
+                            f'{serial}.json')
+        os.makedirs(os.path.dirname(spec), exist_ok=True)
+        proc = await self.arun_proc(
+            f'java -jar {bundletool} get-device-spec '
+            f'--output="{spec}" '
+            f'--overwrite '
+            f'--device-id="{self.obj.serial}"'
+        )
+        if proc.returncode:
+            self.printl(proc.stderr)
+            raise InstallError(self.package, 'failed to get device spec')
+        return spec
+
+    def get_apks_path(self, spec: str) -> str:
+        """Get path to APK set keyed by hash of the AAB and device spec
+        fields which affect split selection.
+
+        :param spec: path to JSON file with device spec
+        :type spec: str
+
+        :return: path to APK set
+        :rtype: str
+        """
+        with open(spec, 'r', encoding='utf-8') as stream:
+            loaded = json.load(stream)
+        key = {
+            'aab': checksum.file_hash.get_hash(self.path),
+            'abis': loaded.get('supportedAbis', []),
+            'density': loaded.get('screenDensity'),
+            'sdk': loaded.get('sdkVersion'),
+            'locales': sorted(loaded.get('supportedLocales', []))
+        }
+        digest = hashlib.sha256(
+            json.dumps(key, sort_keys=True).encode()).hexdigest()
+        return os.path.join(os.path.dirname(spec), f'{digest[:32]}.apks')
+
+    async def abuild_apks(self, bundletool: str) -> str:
+        """Build APK set for connected device or take it from cache.
+
+        APK sets are stored next to the AAB, so identical devices share one
+        build-apks run.
+
+        :param bundletool: path to bundletool.jar
+        :type bundletool: str
+
+        :return: path to APK set
+        :rtype: str
+        """
+        spec = await self.aget_device_spec(bundletool)
+        apks = await asyncio.get_running_loop().run_in_executor(
+            None, self.get_apks_path, spec)
+        with APKS_LOCK:
+            lock = APKS_LOCKS.setdefault(apks, threading.Lock())
+        # shared with threads of other engines; polled, so that a cancelled
+        # task never leaves the lock taken
+        while not lock.acquire(blocking=False):
+            await asyncio.sleep(0.1)
+        try:
+            if os.path.isfile(apks):
+                self.printl(f'{os.path.basename(apks)} found in cache')
+                return apks
+            aab_key = os.path.abspath(config.conf["aab_key"])
+            tmp = f'{os.path.splitext(apks)[0]}.{os.getpid()}.apks'
+            self.printl(f'building {os.path.basename(apks)} ... ')
+            proc = await self.arun_proc(
+                f'java -jar {bundletool} build-apks '
+                f'--bundle="{self.path}" '
+                f'--output="{tmp}" '
+                f'--overwrite '
+                f'--ks="{aab_key}" '
+                f'--ks-pass=pass:passwd '
+                f'--ks-key-alias=ar '
+                f'--device-spec="{spec}"'
+            )
+            if proc.returncode:
+                self.printl(proc.stderr)
+                raise InstallError(self.package, 'failed to build APK set')
+            os.replace(tmp, apks)
+            self.printl('done')
+            return apks
+        finally:
+            lock.release()
+
+    async def ainstall_apks(self) -> None:
+        """Build APK set from the AAB and install it with bundletool.
+        """
+        bundletool = os.path.abspath(config.conf["bundletool"])
+        apks = await self.abuild_apks(bundletool)
+
+        self.printl(f'installing {os.path.basename(apks)} ... ')
+        proc = await self.arun_proc(
+            f'java -jar {bundletool} install-apks '
+            f'--apks="{apks}" '
+            f'--device-id="{self.obj.serial}"'
+        )
+        if proc.returncode:
+            self.printl(proc.stderr)
+            raise InstallError(self.package, 'failed to install APK set')
+        self.printl('done')
+
+    async def ainstall(self) -> bool:
+        if 'aab' not in self.device['ptype']:
+            return await super().ainstall()
         self.printl(f'installing {self.package} ...')
         try:
-            if 'aab' in self.device['ptype']:
-                aab = os.path.join(config.conf["download_dir"], self.package)
-                bundletool = os.path.abspath(config.conf["bundletool"])
-                aab_key = os.path.abspath(config.conf["aab_key"])
-                apks = os.path.join(config.conf['download_dir'], "target.apks")
-
-                if os.path.exists(apks):
-                    os.remove(apks)
-
-                self.printl('building target.apks ... ')
-                proc = self.run_proc(
-                    f'java -jar {bundletool} build-apks '
-                    f'--bundle="{aab}" '
-                    f'--output="{apks}" '
-                    f'--overwrite '
-                    f'--ks="{aab_key}" '
-                    f'--ks-pass=pass:passwd '
-                    f'--ks-key-alias=ar '
-                    f'--connected-device '
-                    f'--device-id="{self.obj.serial}"'
-                )
-                if proc.returncode:
-                    self.printl(proc.stderr)
-                    raise InstallError(self.package,
-                                       'failed to build target.apks')
-                else:
-                    self.printl('done')
+            await self.ainstall_apks()
+            self.printl(f'successfully installed {self.package}')
+            return True
+        except InstallError as e:
+            self.printl(f'failed to install {self.package}')
+            self.printl(str(e))
+            return False
 
-                self.printl('installing target.apks ... ')
-                proc = self.run_proc(
-                    f'java -jar {bundletool} install-apks '
-                    f'--apks="{apks}" '
-                    f'--device-id="{self.obj.serial}"'
-                )
-                if proc.returncode:
-                    self.printl(proc.stderr)
-                    raise InstallError(self.package,
-                                       'failed to install target.apks')
-                else:
-                    self.printl('done')
+    def install(self) -> bool:
+        if 'aab' in self.device['ptype']:
+            return asyncio.run(self.ainstall())
+        self.printl(f'installing {self.package} ...')
+        try:
+            if self.is_growing():
+                self.install_growing()
             else:
-                self.obj.install(
-                    os.path.join(config.conf['download_dir'], self.package),
-                    reinstall=True,
-                    downgrade=True
-                )
+                self.obj.install(self.path, reinstall=True, downgrade=True)
             self.printl(f'successfully installed {self.package}')
             return True
         except InstallError as e:
@@ -338,11 +1457,13 @@ class MacOS(Nix):
         # /Users/user/Library/Application Support/com.addreality.player2
         return True
 
+    def transfer(self) -> bool:
+        self.upload(f'{self.dest}/{self.package}')
+        return True
+
     def install(self) -> bool:
         pkg = f'{self.dest}/{self.package}'
 
-        self.upload(pkg)
-
         self.printl(f'installing {self.package} ...')
         self.exec(
             f'sudo installer -allowUntrusted -pkg {pkg} -target /Applications',
@@ -360,29 +1481,46 @@ class Linux(Nix):
         # TODO: find, remove residual data
         return True
 
+    def can_stream(self) -> bool:
+        return not config.conf['stream_extract']
+
+    def transfer(self) -> bool:
+        if not config.conf['stream_extract']:
+            self.upload(f'{self.dest}/{self.package}')
+        return True
+
     def install(self) -> bool:
         pkg = f'{self.dest}/{self.package}'
         player_dir = f'{self.dest}/{self.package.rstrip(".zip")}'
 
-        self.printl('closing previous version')
         proc = config.conf["editions"][self.device["edition"]]["linux"]["proc"]
-        self.exec(f'pkill "{proc}"')
-
-        self.printl(f'preparing {player_dir} ...')
-        self.exec(f'rm -rf {player_dir} ; mkdir {player_dir}')
-        self.printl(f'done')
-
-        self.upload(pkg)
+        # pkill fails when no process matches
+        if not self.run_steps([
+            ('closing previous version', f'pkill "{proc}" || true'),
+            (f'preparing {player_dir} ...',
+             f'rm -rf {player_dir} ; mkdir {player_dir}')
+        ]):
+            return False
 
-        self.printl(f'extracting {self.package} to {player_dir} ...')
-        self.exec(f'unzip {pkg} -d {player_dir}')
-        self.printl(f'done')
+        steps = []
+        if config.conf['stream_extract']:
+            self.printl(f'streaming {self.package} to {player_dir} ...')
+            status = self.exec_stream(
+                f'tar -x -C {player_dir}',
+                lambda f: stream.zip_to_tar(self.path, f)
+            )
+            if status:
+                self.printl(f'extraction failed, exit status {status}')
+                return False
+            self.printl('done')
+        else:
+            steps.append((f'extracting {self.package} to {player_dir} ...',
+                          f'unzip {pkg} -d {player_dir}'))
 
-        self.printl('launching application')
         app = config.conf["editions"][self.device["edition"]]["linux"]["app"]
-        self.exec(f'DISPLAY=:0 nohup "{player_dir}/./{app}"')
-
-        return True
+        steps.append(('launching application',
+                      f'DISPLAY=:0 nohup "{player_dir}/./{app}"'))
+        return self.run_steps(steps)
 
 
 class Raspbian(Nix):
@@ -421,66 +1559,282 @@ class Debian(Nix):
         # TODO: find, remove residual data
         return True
 
+    def transfer(self) -> bool:
+        self.upload(f'{self.dest}/{self.package}')
+        return True
+
     def install(self) -> bool:
         pkg = f'{self.dest}/{self.package}'
 
-        self.upload(pkg)
-
         passwd = pwd.UserPassword().get_password(self.device['username'])
-
-        self.printl('closing previous version')
         proc = \
             config.conf["editions"][self.device["edition"]]["ubuntu"]["proc"]
-        self.exec(f'pkill {proc}')
-
-        self.printl('installing application ... ')
-        self.exec(f'sudo dpkg -i {pkg}', passwd)
-
-        self.printl('launching application ... ')
         app = config.conf["editions"][self.device["edition"]]["ubuntu"]["app"]
-        self.exec(f'DISPLAY=:0 nohup {app}')
-
-        return True
+        return self.run_steps([
+            ('closing previous version', f'pkill {proc} || true'),
+            ('installing application ... ', f'sudo dpkg -i {pkg}'),
+            ('launching application ... ', f'DISPLAY=:0 nohup {app}')
+        ], passwd)
 
 
 class SharedHost(Driver):
     """Deployment to shared host (shared_host in config.yaml)
     """
+    SMB_BUFFER = 1024 * 1024
+    MANIFEST = '.integra-manifest.json'
+    STAGED = '.integra-new'
+    KEEP = ()
+
     def connect(self) -> Union[Any, None]:
-        self.printl(f'smbclient to {self.device["host"]} ...')
+        server = get_host(self.device)
+        self.printl(f'smbclient to {server} ...')
         try:
             smbclient.ClientConfig(require_secure_negotiate=False)
-            smbclient.register_session(self.device['host'],
-                                       require_signing=False)
+            smb_sessions.register(server, require_signing=False)
         except Exception as e:
             self.printl('unable to connect')
             self.printl(str(e))
             return None
         self.printl(f'checking {self.dest} ...')
-        if not smbclient.path.isdir(self.dest):
-            self.printl(f'{self.dest} does not exist')
+        try:
+            if not smbclient.path.isdir(self.dest):
+                self.printl(f'{self.dest} does not exist')
+                return None
+        except Exception as e:
+            smb_sessions.evict(server)
+            self.printl(str(e))
             return None
         self.printl('path found')
         return self.dest
 
+    def is_synced(self) -> bool:
+        """Check if the share is updated by :meth:`sync`.
+
+        :return: True in sync mode
+        :rtype: bool
+        """
+        return config.conf['shared_host_sync']
+
     def cleanup(self) -> bool:
+        if self.is_synced():
+            self.printl('sync mode, skipping clean-up')
+            return True
         self.printl(f'removing all data in {self.dest} ...')
         for root, dirs, files in smbclient.walk(self.dest):
             for f in files:
+                if root == self.dest and f in self.KEEP:
+                    continue
                 smbclient.unlink(os.path.join(root, f))
             for d in dirs:
                 smbclient.shutil.rmtree(os.path.join(root, d))
         self.printl(f'successfully cleaned')
         return True
 
+    @staticmethod
+    def get_name(name: str) -> str:
+        """Normalise archive member name: absolute paths and '..' are
+        dropped, as zipfile.extractall does.
+
+        :param name: member name
+        :type name: str
+
+        :return: relative path with '/' separators
+        :rtype: str
+        """
+        return '/'.join(p for p in name.split('/')
+                        if p not in ('', '.', '..'))
+
+    def get_remote(self, name: str) -> str:
+        """Get remote path of archive member.
+
+        :param name: member name
+        :type name: str
+
+        :return: UNC path inside destination directory
+        :rtype: str
+        """
+        name = self.get_name(name)
+        parts = name.split('/') if name else []
+        return '\\'.join([self.dest.rstrip('\\')] + parts)
+
+    def get_dirs(self, infos: list) -> set:
+        """Get directories of archive members: explicit directory entries
+        and parents of all members.
+
+        :param infos: list of zipfile.ZipInfo
+        :type infos: list
+
+        :return: normalised directory names
+        :rtype: set
+        """
+        dirs = set()
+        for info in infos:
+            name = self.get_name(info.filename)
+            if not info.is_dir():
+                name = os.path.dirname(name)
+            while name and name not in dirs:
+                dirs.add(name)
+                name = os.path.dirname(name)
+        return dirs
+
+    def make_dirs(self, infos: list) -> None:
+        """Create remote directories for archive members, parents first.
+
+        :param infos: list of zipfile.ZipInfo
+        :type infos: list
+        """
+        for name in sorted(self.get_dirs(infos)):
+            smbclient.makedirs(self.get_remote(name), exist_ok=True)
+
+    def extract_members(self, members: list, suffix: str = '') -> None:
+        """Extract archive members to destination directory through one
+        archive handle and buffered SMB writes.
+
+        :param members: list of zipfile.ZipInfo (files only)
+        :type members: list
+
+        :param suffix: suffix appended to remote file names
+        :type suffix: str
+        """
+        with zipfile.ZipFile(self.path) as package:
+            for info in members:
+                with package.open(info) as src, smbclient.open_file(
+                        self.get_remote(info.filename) + suffix, mode='wb',
+                        buffering=self.SMB_BUFFER) as dst:
+                    shutil.copyfileobj(src, dst, self.SMB_BUFFER)
+
+    def extract(self, files: list, suffix: str = '') -> None:
+        """Extract files with smb_workers concurrent writers.
+
+        :param files: list of zipfile.ZipInfo (files only)
+        :type files: list
+
+        :param suffix: suffix appended to remote file names
+        :type suffix: str
+        """
+        # balance workers by dealing largest files first
+        workers = config.conf['smb_workers']
+        files = sorted(files, key=lambda i: i.file_size, reverse=True)
+        with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+            futures = [
+                executor.submit(self.extract_members, files[i::workers],
+                                suffix)
+                for i in range(min(workers, len(files)))
+            ]
+            for future in futures:
+                future.result()
+
+    def load_manifest(self) -> Union[dict, None]:
+        """Load manifest of previous deployment from the share.
+
+        :return: dict with 'files' (member name -> [size, CRC-32]) and
+                 'dirs' (list of directory names) or None if there is no
+                 manifest
+        :rtype: Union[dict, None]
+        """
+        try:
+            with smbclient.open_file(self.get_remote(self.MANIFEST),
+                                     mode='r') as stream:
+                manifest = json.load(stream)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(manifest, dict) or 'files' not in manifest:
+            return None
+        if 'dirs' not in manifest:
+            dirs = set()
+            for name in manifest['files']:
+                name = os.path.dirname(name)
+                while name:
+                    dirs.add(name)
+                    name = os.path.dirname(name)
+            manifest['dirs'] = list(dirs)
+        return manifest
+
+    def save_manifest(self, files: dict, dirs: set) -> None:
+        """Save manifest of deployed files and directories to the share.
+
+        :param files: dict member name -> [size, CRC-32]
+        :type files: dict
+
+        :param dirs: directory names
+        :type dirs: set
+        """
+        with smbclient.open_file(self.get_remote(self.MANIFEST),
+                                 mode='w') as stream:
+            json.dump({'package': self.package, 'files': files,
+                       'dirs': sorted(dirs)}, stream)
+
+    def sync(self, infos: list) -> None:
+        """Bring the share in line with the archive using manifest of the
+        previous deployment: changed and added files are staged under
+        temporary names and renamed over old ones when all are written,
+        then removed files and directories are deleted. Manifest is written
+        last, so an interrupted sync is completed by the next one.
+
+        Every file is swapped atomically, so no file is ever seen partly
+        written; the swap of the whole set is not atomic, but it is only as
+        long as the renames, as all data is written beforehand. A directory
+        swap would need the unchanged files copied too, which sync avoids.
+
+        :param infos: list of zipfile.ZipInfo
+        :type infos: list
+        """
+        manifest = self.load_manifest()
+        if manifest is None:
+            self.printl('no manifest found, wiping share')
+            for root, dirs, names in smbclient.walk(self.dest):
+                for f in names:
+                    smbclient.unlink(os.path.join(root, f))
+                for d in dirs:
+                    smbclient.shutil.rmtree(os.path.join(root, d))
+            manifest = {'files': {}, 'dirs': []}
+        old = manifest['files']
+        dirs = self.get_dirs(infos)
+        self.make_dirs(infos)
+        files = [i for i in infos if not i.is_dir()]
+        new = {self.get_name(i.filename): [i.file_size, i.CRC]
+               for i in files}
+        changed = [i for i in files if new[self.get_name(i.filename)] !=
+                   old.get(self.get_name(i.filename))]
+        removed = [name for name in old if name not in new]
+        self.printl(f'{len(changed)} changed, {len(removed)} removed, '
+                    f'{len(files) - len(changed)} unchanged')
+
+        self.extract(changed, self.STAGED)
+        for info in changed:
+            remote = self.get_remote(info.filename)
+            smbclient.replace(remote + self.STAGED, remote)
+        for name in removed:
+            try:
+                smbclient.remove(self.get_remote(name))
+            except FileNotFoundError:
+                pass
+        # deepest first; directories holding foreign files are kept
+        for name in sorted(set(manifest['dirs']) - dirs,
+                           key=lambda n: n.count('/'), reverse=True):
+            try:
+                smbclient.rmdir(self.get_remote(name))
+            except OSError:
+                pass
+        self.save_manifest(new, dirs)
+
     def install(self) -> bool:
         self.printl(f'extracting {self.package} to {self.dest} ...')
-        package = \
-            zipfile.ZipFile(os.path.join(config.conf['download_dir'],
-                                         self.package))
-        package.extractall(path=self.dest)
-        self.printl(f'done')
-        package.close()
+        with zipfile.ZipFile(self.path) as package:
+            infos = package.infolist()
+        files = [i for i in infos if not i.is_dir()]
+        if self.is_synced():
+            self.sync(infos)
+        else:
+            # files extracted over the share are no longer described by
+            # manifest of a previous sync, which next sync would trust
+            try:
+                smbclient.unlink(self.get_remote(self.MANIFEST))
+            except OSError:
+                pass
+            self.make_dirs(infos)
+            self.extract(files)
+            self.printl(f'{len(files)} files extracted')
         return True
 
 
@@ -494,34 +1848,145 @@ class WebOS(SharedHost):
     """Driver for LG webOS Signage.
     Installs production package.
     """
+    # overwritten by transfer anyway, and kept so that an identical copy
+    # is not sent again
+    KEEP = ('Player.ipk',)
+
+    def can_stream(self) -> bool:
+        return True
+
+    def is_synced(self) -> bool:
+        # only Player.ipk is copied, so the share is always cleaned
+        return False
+
+    def transfer(self) -> bool:
+        self.smb_stage(f'{self.dest}\\Player.ipk')
+        return True
+
     def install(self) -> bool:
-        pkg = f'{self.dest}\\Player.ipk'
-        self.printl(f'copying {self.package} to {pkg} ...')
-        smbclient.shutil.copy(
-            os.path.join(config.conf['download_dir'], self.package),
-            pkg
-        )
-        self.printl(f'done')
         return True
 
 
+class WebOSState:
+    """State of webOS devices kept in download_dir between runs: hash of
+    the info the device was registered in ares with and ID of application
+    installed by the last deployment.
+
+    :ivar lock: lock guarding state file
+    """
+    STATE = 'webos.yaml'
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def get_file(self) -> str:
+        return os.path.join(config.conf['download_dir'], self.STATE)
+
+    def load(self) -> dict:
+        """Load state (re-read every time, as other processes may update it).
+
+        :return: dict device name -> {'info': hash, 'aid': app ID}
+        :rtype: dict
+        """
+        try:
+            with open(self.get_file(), 'r', encoding='utf-8') as stream:
+                return yaml.safe_load(stream) or {}
+        except (OSError, yaml.YAMLError):
+            return {}
+
+    def get(self, name: str) -> dict:
+        """Get state of a device.
+
+        :param name: device's name
+        :type name: str
+
+        :return: device's state
+        :rtype: dict
+        """
+        with self.lock:
+            return self.load().get(name, {})
+
+    def update(self, name: str, **kwargs) -> None:
+        """Update state of a device; None values are removed.
+
+        :param name: device's name
+        :type name: str
+        """
+        with self.lock:
+            state = self.load()
+            entry = state.setdefault(name, {})
+            entry.update(kwargs)
+            state[name] = {k: v for k, v in entry.items() if v is not None}
+            os.makedirs(config.conf['download_dir'], exist_ok=True)
+            tmp = f'{self.get_file()}.{os.getpid()}.tmp'
+            with open(tmp, 'w', encoding='utf-8') as stream:
+                yaml.safe_dump(state, stream)
+            os.replace(tmp, self.get_file())
+
+
+webos_state = WebOSState()
+
+
 class WebOSdebug(Driver):
     """Driver for LG webOS Signage.
     Installs debug package.
 
+    ares-* tools are run as asyncio subprocesses; synchronous methods run
+    the coroutines in their own event loop. Device registration and ID of
+    installed application are remembered in :data:`webos_state`, so that
+    ares-setup-device and ares-install --list are run only when needed;
+    both are forgotten once an ares-* command fails.
+
     :ivar aid: application ID
+    :ivar info: device info for ares-setup-device
+    :ivar cached: registration was taken from webos_state
     """
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.aid = None
+        self.info = None
+        self.cached = False
+
+    @staticmethod
+    def read_aid(path: str) -> Union[str, None]:
+        """Read application ID (Package field of control file) from ipk,
+        which is an ar archive with control.tar.gz inside.
+
+        :param path: path to ipk
+        :type path: str
 
-    def get_aid(self) -> Union[str, None]:
+        :return: application ID or None if not found
+        :rtype: Union[str, None]
+        """
+        with open(path, 'rb') as f:
+            if f.read(8) != b'!<arch>\n':
+                return None
+            while True:
+                header = f.read(60)
+                if len(header) < 60:
+                    return None
+                name = header[:16].decode().strip().rstrip('/')
+                size = int(header[48:58].decode().strip())
+                data = f.read(size)
+                f.read(size % 2)
+                if name.startswith('control.tar'):
+                    break
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            for member in tar.getmembers():
+                if member.name.lstrip('./') != 'control':
+                    continue
+                control = tar.extractfile(member).read().decode()
+                match = re.search(r'^Package:\s*(\S+)', control, re.M)
+                return match.group(1) if match else None
+        return None
+
+    async def aget_aid(self) -> Union[str, None]:
         """Get application ID.
 
         :return: APP_ID
         :rtype: Union[str, None]
         """
-        proc = self.run_proc(
+        proc = await self.arun_ares(
             f'ares-install --device {self.device["name"]} --list')
         if proc.returncode:
             self.printl(proc.stderr)
@@ -535,42 +2000,86 @@ class WebOSdebug(Driver):
                 self.printl('no target application found')
                 return None
 
-    def connect(self) -> Union[Any, None]:
+    async def arun_ares(self, cmd: str) -> subprocess.CompletedProcess:
+        """Run ares-* command. On failure, registration and application ID
+        are forgotten, as ares may have lost the device (e.g. its config was
+        reset or ares was reinstalled), so that next run sets it up again.
+
+        :param cmd: command
+        :type cmd: str
+
+        :return: object of completed process
+        :rtype: subprocess.CompletedProcess
+        """
+        proc = await self.arun_proc(cmd)
+        if proc.returncode:
+            webos_state.update(self.device['name'], info=None, aid=None)
+        return proc
+
+    async def asetup(self) -> bool:
+        """Register device with ares or update its info.
+
+        :return: True on success and False on failure
+        :rtype: bool
+        """
         self.printl(f'setting up {self.device["name"]}...')
-        phrase = pwd.UserPassword().get_password(self.device['name'])
-        info = f"'name':'{self.device['name']}'," \
-               f"'host':'{self.device['host']}'," \
-               f"'port':'{self.device['port']}'," \
-               f"'username':'{self.device['username']}'," \
-               f"'description':'{self.device['description']}'," \
-               f"'privatekey':'{self.device['name']}','" \
-               f"'passphrase':'{phrase}'"
-        proc = self.run_proc(
+        proc = await self.arun_proc(
             f'ares-setup-device --add {self.device["name"]} '
-            f'--info "{{{info}}}"'
+            f'--info "{{{self.info}}}"'
         )
-        self.get_aid()
         if proc.returncode:
-            pass
-            # self.printl(proc.stderr)
+            # device is already known to ares, but with other info
+            proc = await self.arun_proc(
+                f'ares-setup-device --modify {self.device["name"]} '
+                f'--info "{{{self.info}}}"'
+            )
+        if proc.returncode:
+            self.printl(proc.stderr)
+            return False
+        self.printl(proc.stdout)
+        webos_state.update(self.device['name'],
+                           info=hashlib.sha256(self.info.encode()).hexdigest())
+        return True
+
+    async def aconnect(self) -> Union[Any, None]:
+        phrase = pwd.UserPassword().get_password(self.device['name'])
+        self.info = f"'name':'{self.device['name']}'," \
+                    f"'host':'{self.device['host']}'," \
+                    f"'port':'{self.device['port']}'," \
+                    f"'username':'{self.device['username']}'," \
+                    f"'description':'{self.device['description']}'," \
+                    f"'privatekey':'{self.device['name']}','" \
+                    f"'passphrase':'{phrase}'"
+        digest = hashlib.sha256(self.info.encode()).hexdigest()
+        state = webos_state.get(self.device['name'])
+        self.cached = state.get('info') == digest
+        if self.cached:
+            self.printl(f'{self.device["name"]} is already set up')
         else:
-            self.printl(proc.stdout)
+            await self.asetup()
+
+        if 'aid' in state:
+            self.aid = state['aid']
+            self.printl(f'found {self.aid}')
+        else:
+            await self.aget_aid()
         return True
 
-    def cleanup(self) -> bool:
+    async def acleanup(self) -> bool:
         if not self.aid:
             self.printl('previous version not found, skipping clean-up')
             return True
 
-        proc = self.run_proc(
+        proc = await self.arun_proc(
             f'ares-launch --device {self.device["name"]} --close {self.aid}')
         if proc.returncode:
             self.printl(proc.stderr)
         else:
             self.printl(proc.stdout)
 
-        proc = self.run_proc(
+        proc = await self.arun_ares(
             f'ares-install --device {self.device["name"]} --remove {self.aid}')
+        webos_state.update(self.device['name'], aid=None)
         if proc.returncode:
             self.printl(proc.stderr)
             return False
@@ -579,20 +2088,27 @@ class WebOSdebug(Driver):
         self.printl('application closed and removed')
         return True
 
-    def install(self) -> bool:
+    async def ainstall(self) -> bool:
         self.printl(f'installing {self.package} ...')
-        proc = self.run_proc(
-            f'ares-install --device {self.device["name"]} '
-            f'{os.path.join(config.conf["download_dir"], self.package)}'
-        )
+        cmd = f'ares-install --device {self.device["name"]} {self.path}'
+        proc = await self.arun_ares(cmd)
+        if proc.returncode and self.cached:
+            # registration may be stale, set device up once more and retry
+            self.printl(proc.stderr)
+            self.cached = False
+            if await self.asetup():
+                proc = await self.arun_ares(cmd)
         if proc.returncode:
             self.printl('installation failed')
             self.printl(proc.stderr)
             return False
         else:
             self.printl('installation successful')
-            self.get_aid()
-            proc2 = self.run_proc(
+            self.aid = self.read_aid(self.path)
+            if self.aid is None:
+                await self.aget_aid()
+            webos_state.update(self.device['name'], aid=self.aid)
+            proc2 = await self.arun_ares(
                 f'ares-launch --device {self.device["name"]} {self.aid}')
             if proc2.returncode:
                 self.printl(proc2.stderr)
@@ -601,16 +2117,52 @@ class WebOSdebug(Driver):
                 self.printl(proc2.stdout)
         return True
 
+    def connect(self) -> Union[Any, None]:
+        return asyncio.run(self.aconnect())
+
+    def cleanup(self) -> bool:
+        return asyncio.run(self.acleanup())
+
+    def install(self) -> bool:
+        return asyncio.run(self.ainstall())
+
 
 class Web(Nix):
     """Driver for web version.
 
+    In warm mode (web_warm in config.yaml) the container is kept between
+    deployments: nginx serves /srv/current, a symlink to one of releases
+    in /srv/releases, which is flipped to a new release on deployment.
+
     :ivar dclient: docker client
     """
+    WARM_LABEL = 'integra.warm'
+    WARM_COMMAND = [
+        'sh', '-c',
+        'rm -rf /usr/share/nginx/html && '
+        'ln -s /srv/current /usr/share/nginx/html && '
+        'exec nginx -g "daemon off;"'
+    ]
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.dclient = None
 
+    def can_stream(self) -> bool:
+        return False
+
+    def is_warm(self) -> bool:
+        """Check if existing container can be updated in place.
+
+        :return: True if container is a running warm one on the right port
+        :rtype: bool
+        """
+        bindings = self.obj.ports.get('80/tcp') or []
+        return config.conf['web_warm'] and \
+            self.obj.status == 'running' and \
+            self.WARM_LABEL in self.obj.labels and \
+            str(self.device['cport']) in [b['HostPort'] for b in bindings]
+
     def connect(self):
         base_url = f'tcp://{self.device["host"]}:2375'
         try:
@@ -623,20 +2175,35 @@ class Web(Nix):
             self.printl(f'daemon present')
             try:
                 self.obj = self.dclient.containers.get(self.device['name'])
-                self.obj.stop()
-                self.obj.remove()
-                self.printl(f'removed expired container {self.obj.short_id}')
+                if self.is_warm():
+                    self.printl(f'reusing container {self.obj.short_id}')
+                else:
+                    self.obj.stop()
+                    self.obj.remove()
+                    self.printl(
+                        f'removed expired container {self.obj.short_id}')
+                    self.obj = None
             except Exception as e:
+                self.obj = None
                 self.printl(str(e))
         except Exception as e:
             self.printl(str(e))
             return None
-        if self.device['remote']:
+        if self.device['remote'] and not config.conf['web_put_archive'] \
+                and not config.conf['web_warm']:
             return super().connect()
         else:
             return self.dclient
 
     def cleanup(self) -> bool:
+        if config.conf['web_warm']:
+            self.printl('package goes into a new release of warm '
+                        'container, skipping clean-up')
+            return True
+        if config.conf['web_put_archive']:
+            self.printl('package goes into a new container, '
+                        'skipping clean-up')
+            return True
         self.printl(f'preparing {self.dest} ...')
         if self.device['remote']:
             self.client.exec_command(f'rm -rf {self.dest} ; mkdir {self.dest}')
@@ -652,14 +2219,102 @@ class Web(Nix):
         self.printl(f'done')
         return True
 
+    def install_archive(self) -> bool:
+        """Create container and stream package contents into it as a tar
+        archive through Docker API, without staging them on the host.
+
+        :return: True on success and False on failure
+        :rtype: bool
+        """
+        params = {
+            'name': self.device['name'],
+            'ports': {'80/tcp': self.device['cport']}
+        }
+        try:
+            self.obj = self.dclient.containers.create('nginx', **params)
+        except docker.errors.ImageNotFound:
+            self.printl('pulling nginx image ...')
+            self.dclient.images.pull('nginx')
+            self.obj = self.dclient.containers.create('nginx', **params)
+
+        self.printl(f'streaming {self.package} to {self.obj.short_id} ...')
+        pipe = stream.Pipe().run(lambda f: stream.zip_to_tar(self.path, f))
+        try:
+            if not self.obj.put_archive('/usr/share/nginx/html', pipe):
+                self.printl('failed to put archive')
+                return False
+        finally:
+            pipe.abort()
+        self.obj.start()
+        self.printl(f'{self.obj.short_id} deployed')
+        return True
+
+    def install_warm(self) -> bool:
+        """Put package as a new release into warm container (created if
+        there is none), flip /srv/current to it atomically, reload nginx
+        and remove previous releases.
+
+        :return: True on success and False on failure
+        :rtype: bool
+        """
+        if self.obj is None:
+            self.printl('creating warm container ...')
+            params = {
+                'command': self.WARM_COMMAND,
+                'name': self.device['name'],
+                'ports': {'80/tcp': self.device['cport']},
+                'labels': {self.WARM_LABEL: '1'}
+            }
+            try:
+                self.obj = self.dclient.containers.create('nginx', **params)
+            except docker.errors.ImageNotFound:
+                self.printl('pulling nginx image ...')
+                self.dclient.images.pull('nginx')
+                self.obj = self.dclient.containers.create('nginx', **params)
+            self.obj.start()
+
+        release = checksum.file_hash.get_hash(self.path)[:12]
+        self.printl(f'streaming {self.package} to {self.obj.short_id} '
+                    f'as release {release} ...')
+        pipe = stream.Pipe().run(lambda f: stream.zip_to_tar(
+            self.path, f, f'releases/{release}'))
+        try:
+            if not self.obj.put_archive('/srv', pipe):
+                self.printl('failed to put archive')
+                return False
+        finally:
+            pipe.abort()
+
+        result = self.obj.exec_run([
+            'sh', '-c',
+            f'ln -sfn releases/{release} /srv/current.new && '
+            f'mv -Tf /srv/current.new /srv/current && '
+            f'nginx -s reload && '
+            f'cd /srv/releases && ls | grep -vx {release} | xargs -r rm -rf'
+        ])
+        if result.exit_code:
+            self.printl(result.output.decode(errors='replace'))
+            self.printl('failed to switch release')
+            return False
+        self.printl(f'{self.obj.short_id} serves release {release}')
+        return True
+
+    def transfer(self) -> bool:
+        if self.device['remote'] and not config.conf['web_put_archive'] \
+                and not config.conf['web_warm']:
+            self.upload(f'{self.dest}/{self.package}')
+        return True
+
     def install(self) -> bool:
+        if config.conf['web_warm']:
+            return self.install_warm()
+        if config.conf['web_put_archive']:
+            return self.install_archive()
+
         self.printl(f'extracting {self.package} to {self.dest} ...')
-        lpkg = os.path.join(config.conf['download_dir'], self.package)
+        lpkg = self.path
         if self.device['remote']:
             rpkg = f'{self.dest}/{self.package}'
-            sftp = self.client.open_sftp()
-            sftp.put(lpkg, rpkg)
-            sftp.close()
             self.client.exec_command(f'unzip {rpkg} -d {self.dest}')
         else:
             package = zipfile.ZipFile(lpkg)
@@ -5,19 +5,20 @@ import pathlib
 import copy
 import logging
 import threading
+import multiprocessing
 
 import yaml
 
 from kivy import resources
 from kivy import logger
-from kivy.core import window
 from kivy import app as kivy_app, properties
 from kivy.uix.recycleview import views
 from kivy.uix import recycleview, boxlayout, textinput, button, dropdown
 
 import config
-from utils import log, pwd
+from utils import log, pwd, serve
 import deploy
+import drivers
 
 
 class DropdownButton(button.Button):
@@ -160,8 +161,17 @@ class IntegraApp(kivy_app.App):
             self.dropdown_edition.add_widget(item)
         self.dropdown_edition.bind(on_select=self.dropdown_edition.update)
 
+    def on_stop(self):
+        drivers.ssh_pool.close()
+        drivers.smb_sessions.close()
+        drivers.winrm_pool.close()
+        serve.server.stop()
+
 
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    from kivy.core import window
+
     if hasattr(sys, '_MEIPASS'):
         resources.resource_add_path(os.path.join(sys._MEIPASS))
     window.Window.size = (1240, 768)
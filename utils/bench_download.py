@@ -0,0 +1,199 @@
+"""Test and benchmark of package downloads against a local HTTP stand-in
+server.
+
+The server serves one random file, with or without range support, and
+limits the rate of every connection (as a file server behind a per-stream
+bottleneck does). Checks run first:
+
+- single-stream and multi-range downloads produce the file and its checksum;
+- a multi-range download broken off by the server is resumed from its state
+  file and fetches only the missing part.
+
+Then single-stream and multi-range throughput is compared.
+
+Usage (from the repository root)::
+
+    python -m utils.bench_download --size 64 --rate 8 --threads 1,4,8
+"""
+import os
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import threading
+import http.server
+
+import config
+import client
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    """Handler serving server's data at any path; honours single byte
+    ranges if the server supports them.
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_headers(self) -> tuple:
+        data = self.server.data
+        start, end = 0, len(data) - 1
+        ranged = self.server.ranges and 'Range' in self.headers
+        if ranged:
+            first, last = self.headers['Range'].split('=')[1].split('-')
+            start, end = int(first), int(last or end)
+            self.send_response(206)
+            self.send_header('Content-Range',
+                             f'bytes {start}-{end}/{len(data)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        if self.server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', f'"{self.server.etag}"')
+        self.end_headers()
+        return start, end + 1
+
+    def do_HEAD(self):
+        self.send_headers()
+
+    def do_GET(self):
+        start, end = self.send_headers()
+        started = time.time()
+        sent = 0
+        while start + sent < end:
+            chunk = self.server.data[start + sent:
+                                     min(start + sent + self.CHUNK_SIZE, end)]
+            with self.server.lock:
+                if self.server.budget is not None:
+                    if self.server.budget <= 0:
+                        # break the connection off in the middle of data
+                        self.close_connection = True
+                        return
+                    self.server.budget -= len(chunk)
+                self.server.sent += len(chunk)
+            self.wfile.write(chunk)
+            sent += len(chunk)
+            if self.server.rate:
+                delay = sent / self.server.rate - (time.time() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+
+class StandInServer(http.server.ThreadingHTTPServer):
+    """Local file server.
+
+    :ivar data: served file
+    :ivar etag: ETag of the file
+    :ivar ranges: True if range requests are supported
+    :ivar rate: bytes per second per connection (0 for no limit)
+    :ivar budget: bytes left to send before breaking connections off
+                  (None for no limit)
+    :ivar sent: bytes of data sent
+    """
+    daemon_threads = True
+
+    def __init__(self, data: bytes, rate: float):
+        super().__init__(('127.0.0.1', 0), StandInHandler)
+        self.data = data
+        self.etag = hashlib.md5(data).hexdigest()
+        self.ranges = True
+        self.rate = rate
+        self.budget = None
+        self.sent = 0
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_port}/package.bin'
+
+
+class LocalClient(client.FsClient):
+    """File server client which needs no credentials.
+    """
+    def login(self) -> None:
+        self.auth = None
+
+
+def download(fs_client: LocalClient, server: StandInServer,
+             threads: int) -> tuple:
+    """Download the served file into a fresh directory.
+
+    :return: (hex digest, seconds, path)
+    :rtype: tuple
+    """
+    config.conf['download_threads'] = threads
+    path = os.path.join(tempfile.mkdtemp(dir=config.conf['download_dir']),
+                        'package.bin')
+    started = time.time()
+    digest = fs_client.fetch(server.url, path)
+    return digest, time.time() - started, path
+
+
+def check(fs_client: LocalClient, server: StandInServer) -> None:
+    """Check single-stream, multi-range and resumed downloads.
+    """
+    expected = server.etag
+    for ranges, threads in ((False, 1), (True, 4)):
+        server.ranges = ranges
+        digest, _, path = download(fs_client, server, threads)
+        with open(path, 'rb') as f:
+            assert f.read() == server.data, 'downloaded data differs'
+        assert digest == expected, 'checksum differs'
+    print('single-stream and multi-range downloads: ok')
+
+    server.ranges = True
+    config.conf['download_threads'] = 4
+    path = os.path.join(tempfile.mkdtemp(dir=config.conf['download_dir']),
+                        'package.bin')
+    server.budget = len(server.data) // 2
+    try:
+        fs_client.fetch(server.url, path)
+    except Exception:
+        pass
+    else:
+        raise AssertionError('download was not broken off')
+    assert os.path.isfile(f'{path}.part.yaml'), 'no state file'
+    server.budget = None
+    server.sent = 0
+    digest = fs_client.fetch(server.url, path)
+    assert digest == expected, 'checksum of resumed download differs'
+    assert server.sent < len(server.data), 'download was not resumed'
+    print(f'resumed download: ok, {server.sent} of {len(server.data)} '
+          f'bytes fetched again')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=64,
+                        help='file size, MB')
+    parser.add_argument('--rate', type=float, default=8,
+                        help='rate of one connection, MB/s (0: no limit)')
+    parser.add_argument('--threads', default='1,4,8',
+                        help='numbers of ranges to compare')
+    args = parser.parse_args()
+
+    data = os.urandom(args.size * 1024 * 1024)
+    server = StandInServer(data, args.rate * 1024 * 1024)
+    config.conf['download_dir'] = tempfile.mkdtemp()
+    config.conf['checksum'] = 'md5'
+    fs_client = LocalClient(pool_size=32)
+    try:
+        check(fs_client, server)
+        server.ranges = False
+        _, elapsed, _ = download(fs_client, server, 1)
+        print(f'single stream: {args.size / elapsed:8.1f} MB/s')
+        server.ranges = True
+        for threads in map(int, args.threads.split(',')):
+            _, elapsed, _ = download(fs_client, server, threads)
+            print(f'{threads:>3} range(s):  {args.size / elapsed:8.1f} MB/s')
+    finally:
+        server.shutdown()
+        shutil.rmtree(config.conf['download_dir'], ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""Benchmark of deployment engines on simulated devices.
+
+Every simulated device spends ``--latency`` seconds in each of connect,
+transfer and install; install runs a real ``sleep`` subprocess, so the
+asyncio engine goes through :meth:`drivers.Driver.arun_proc`. The process is
+pinned to one CPU core where the OS allows it. Peak number of threads of the
+asyncio engine includes threads asyncio may use to wait for child processes
+(one per subprocess before Python 3.12), so peak number of executor threads
+is shown apart.
+
+With ``--download``, the package takes that many seconds to download, which
+shows how much of connection and clean-up an engine overlaps with it.
+
+Usage (from the repository root)::
+
+    python -m utils.bench_engines --devices 300 --latency 0.5
+    python -m utils.bench_engines --devices 8 --download 2
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+import threading
+
+import config
+import deploy
+import drivers
+
+
+class SimulatedDriver(drivers.Driver):
+    """Driver which only waits, as if talking to a remote device.
+    """
+    latency = 0.5
+
+    def connect(self):
+        time.sleep(self.latency)
+        return True
+
+    def cleanup(self) -> bool:
+        return True
+
+    def transfer(self) -> bool:
+        time.sleep(self.latency)
+        return True
+
+    def install(self) -> bool:
+        return not self.run_proc(self.get_command()).returncode
+
+    async def aconnect(self):
+        await asyncio.sleep(self.latency)
+        return True
+
+    async def atransfer(self) -> bool:
+        await asyncio.sleep(self.latency)
+        return True
+
+    async def ainstall(self) -> bool:
+        return not (await self.arun_proc(self.get_command())).returncode
+
+    def get_command(self) -> str:
+        if os.name == 'nt':
+            return f'"{sys.executable}" -c "import time; ' \
+                   f'time.sleep({self.latency})"'
+        return f'sleep {self.latency}'
+
+
+class SimulatedClient:
+    """File server client which downloads the package in ``download``
+    seconds.
+    """
+    download = 0.0
+
+    def login(self) -> None:
+        pass
+
+    def search_packages(self, device: dict) -> list:
+        return [{'name': 'simulated.bin'}]
+
+    def download_package(self, package: dict, on_start=None) -> str:
+        time.sleep(self.download)
+        return package['name']
+
+
+class Button:
+    def deploy_off(self) -> None:
+        pass
+
+
+def run(engine: str, count: int) -> tuple:
+    """Deploy simulated devices with an engine.
+
+    :param engine: engine name
+    :type engine: str
+
+    :param count: number of devices
+    :type count: int
+
+    :return: (wall time, CPU time, peak number of threads, peak number of
+             executor threads)
+    :rtype: tuple
+    """
+    config.conf['engine'] = engine
+    devices = [{
+        'name': f'sim{i}',
+        'ptype': 'simulated',
+        'edition': 'bench',
+        'host': f'10.0.{i // 250}.{i % 250}',
+        'upload_dir': '',
+        'cleanup': False,
+        'selected': True
+    } for i in range(count)]
+    peak = [threading.active_count(), 0]
+    done = threading.Event()
+
+    def sample():
+        while not done.wait(0.05):
+            executors = sum('Executor' in t.name
+                            for t in threading.enumerate())
+            peak[0] = max(peak[0], threading.active_count())
+            peak[1] = max(peak[1], executors)
+
+    threading.Thread(target=sample, daemon=True).start()
+    started, cpu = time.time(), time.process_time()
+    deploy.foreman.start_deploy(devices, Button())
+    done.set()
+    return time.time() - started, time.process_time() - cpu, *peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--devices', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=0.5)
+    parser.add_argument('--download', type=float, default=0.0,
+                        help='seconds to download the package')
+    parser.add_argument('--engines', default='asyncio,threads,pipeline')
+    args = parser.parse_args()
+
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, {min(os.sched_getaffinity(0))})
+    logging.basicConfig(level=logging.WARNING)
+    SimulatedDriver.latency = args.latency
+    drivers.DRIVERS['Simulated'] = SimulatedDriver
+    config.conf['ptypes']['simulated'] = {'driver': 'Simulated',
+                                          'mask': 'simulated'}
+    config.conf['concurrency'] = {
+        'total': args.devices, 'host': 1, 'hosts': {}, 'drivers': {},
+        'stages': {}
+    }
+    SimulatedClient.download = args.download
+    deploy.foreman.fs_client = SimulatedClient()
+
+    ideal = 3 * args.latency
+    print(f'{args.devices} devices, {ideal:.1f} s of waiting each, '
+          f'{args.download:.1f} s to download the package')
+    for engine in args.engines.split(','):
+        wall, cpu, threads, executors = run(engine, args.devices)
+        print(f'{engine:>9}: {wall:6.2f} s wall, {cpu:6.2f} s CPU, '
+              f'{threads} threads ({executors} executor) at peak')
+
+
+if __name__ == '__main__':
+    main()
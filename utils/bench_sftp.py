@@ -0,0 +1,179 @@
+"""Benchmark of SFTP uploads against a local paramiko-based stand-in server.
+
+Compares plain ``SFTPClient.put`` (paramiko's default window and 32 KB
+requests) with :meth:`drivers.Nix.put` (sftp_window_size window, 1 MB
+pipelined writes, optionally split between several channels) and checks that
+every uploaded copy is identical to the original. The server runs in a child
+process, so that it does not share the GIL with the uploads.
+
+Usage (from the repository root)::
+
+    python -m utils.bench_sftp --size 128 --channels 1,4
+"""
+import os
+import time
+import shutil
+import socket
+import logging
+import argparse
+import tempfile
+import multiprocessing
+
+import paramiko
+
+import config
+import drivers
+
+
+class StandInServer(paramiko.ServerInterface):
+    """SSH server accepting any password and SFTP subsystem only.
+    """
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+
+class StandInHandle(paramiko.SFTPHandle):
+    def stat(self):
+        return paramiko.SFTPAttributes.from_stat(
+            os.fstat(self.readfile.fileno()))
+
+    def chattr(self, attr):
+        if attr.st_size is not None:
+            self.writefile.truncate(attr.st_size)
+        return paramiko.SFTP_OK
+
+
+class StandInSFTP(paramiko.SFTPServerInterface):
+    """SFTP server working on local paths as they are.
+    """
+    def open(self, path, flags, attr):
+        try:
+            f = os.fdopen(os.open(path, flags, 0o644),
+                          'r+b' if flags & (os.O_WRONLY | os.O_RDWR)
+                          else 'rb')
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        handle = StandInHandle(flags)
+        handle.filename = path
+        handle.readfile = handle.writefile = f
+        return handle
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def chattr(self, path, attr):
+        if attr._flags & attr.FLAG_AMTIME:
+            os.utime(path, (attr.st_atime, attr.st_mtime))
+        return paramiko.SFTP_OK
+
+
+def serve(ports) -> None:
+    """Run stand-in server on loopback (child process entry point).
+
+    :param ports: queue to put TCP port to
+    """
+    host_key = paramiko.RSAKey.generate(2048)
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(8)
+    ports.put(sock.getsockname()[1])
+    while True:
+        conn, _ = sock.accept()
+        transport = paramiko.Transport(conn)
+        transport.add_server_key(host_key)
+        transport.set_subsystem_handler('sftp', paramiko.SFTPServer,
+                                        StandInSFTP)
+        transport.start_server(server=StandInServer())
+
+
+def timed(upload, local: str, remote: str) -> float:
+    """Run upload and check the copy.
+
+    :return: seconds
+    :rtype: float
+    """
+    started = time.time()
+    upload()
+    elapsed = time.time() - started
+    with open(local, 'rb') as a, open(remote, 'rb') as b:
+        while True:
+            x, y = a.read(1024 * 1024), b.read(1024 * 1024)
+            assert x == y, f'{remote} differs from {local}'
+            if not x:
+                break
+    os.remove(remote)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=128,
+                        help='file size, MB')
+    parser.add_argument('--channels', default='1,4',
+                        help='numbers of SFTP channels to compare')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    local_dir, remote_dir = tempfile.mkdtemp(), tempfile.mkdtemp()
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(ports,),
+                                     daemon=True)
+    server.start()
+    try:
+        local = os.path.join(local_dir, 'package.bin')
+        with open(local, 'wb') as f:
+            for _ in range(args.size):
+                f.write(os.urandom(1024 * 1024))
+        remote = os.path.join(remote_dir, 'package.bin')
+
+        ssh = paramiko.SSHClient()
+        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        ssh.connect('127.0.0.1', ports.get(), 'bench', 'bench',
+                    look_for_keys=False, allow_agent=False)
+        config.conf['download_dir'] = local_dir
+        driver = drivers.Nix({'name': 'bench', 'upload_dir': remote_dir},
+                             'package.bin')
+        driver.client = ssh
+
+        def plain():
+            sftp = ssh.open_sftp()
+            try:
+                sftp.put(local, remote)
+            finally:
+                sftp.close()
+
+        elapsed = timed(plain, local, remote)
+        print(f'plain put:    {args.size / elapsed:8.1f} MB/s')
+        for channels in map(int, args.channels.split(',')):
+            config.conf['sftp_channels'] = channels
+
+            def pipelined():
+                sftp = driver.open_sftp()
+                try:
+                    driver.put(sftp, local, remote)
+                finally:
+                    sftp.close()
+
+            elapsed = timed(pipelined, local, remote)
+            print(f'{channels:>2} channel(s): {args.size / elapsed:8.1f} '
+                  f'MB/s')
+        ssh.close()
+    finally:
+        server.kill()
+        shutil.rmtree(local_dir, ignore_errors=True)
+        shutil.rmtree(remote_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+import os
+import hashlib
+import threading
+
+
+class FileHash:
+    """Hashes of local files, memoized by path, size and modification time.
+
+    :ivar lock: lock guarding hashes
+    :ivar hashes: dict (path, size, mtime, algorithm) -> hex digest
+    """
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hashes = {}
+
+    def get_hash(self, path: str, algorithm: str = 'sha256') -> str:
+        """Get hash of a file.
+
+        :param path: path to file
+        :type path: str
+
+        :param algorithm: name of hash algorithm
+        :type algorithm: str
+
+        :return: hex digest
+        :rtype: str
+        """
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime, algorithm)
+        with self.lock:
+            if key in self.hashes:
+                return self.hashes[key]
+        with open(path, 'rb') as f:
+            digest = self.get_stream_hash(f, algorithm)
+        with self.lock:
+            self.hashes[key] = digest
+        return digest
+
+    @classmethod
+    def get_stream_hash(cls, stream, algorithm: str = 'sha256') -> str:
+        """Get hash of a binary stream read to its end (e.g. remote file).
+
+        :param stream: file-like object
+
+        :param algorithm: name of hash algorithm
+        :type algorithm: str
+
+        :return: hex digest
+        :rtype: str
+        """
+        digest = hashlib.new(algorithm)
+        for chunk in iter(lambda: stream.read(cls.CHUNK_SIZE), b''):
+            digest.update(chunk)
+        return digest.hexdigest()
+
+
+file_hash = FileHash()
@@ -0,0 +1,112 @@
+import os
+import socket
+import logging
+import secrets
+import threading
+import http.server
+import urllib.parse
+
+
+class PackageHandler(http.server.SimpleHTTPRequestHandler):
+    """Static file handler which serves published files only and logs
+    requests through logging instead of stderr (there is no stderr in a
+    windowed build).
+    """
+    def get_file(self):
+        return self.server.files.get(self.path.split('?', 1)[0])
+
+    def send_head(self):
+        if self.get_file() is None:
+            self.send_error(http.HTTPStatus.NOT_FOUND)
+            return None
+        return super().send_head()
+
+    def translate_path(self, path):
+        return self.get_file()
+
+    def log_message(self, format, *args):
+        logging.debug(f'{__name__}: {self.address_string()} {format % args}')
+
+
+class PackageServer:
+    """HTTP server giving deployment targets access to downloaded packages,
+    so that they can pull them instead of having them pushed. A server is
+    started on first use for every local address facing targets and serves
+    only published packages, each under a random URL; all of them are
+    stopped when deployment run ends.
+
+    :ivar lock: lock guarding servers and published files
+    :ivar servers: dict local address -> running server
+    :ivar files: dict URL path -> published file
+    :ivar urls: dict published file -> URL path
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.servers = {}
+        self.files = {}
+        self.urls = {}
+
+    def start(self, address: str, port: int) -> None:
+        """Start server on an address unless it is running (called with lock
+        taken).
+
+        :param address: local address to bind
+        :type address: str
+
+        :param port: TCP port
+        :type port: int
+        """
+        if address in self.servers:
+            return
+        httpd = http.server.ThreadingHTTPServer((address, port),
+                                                PackageHandler)
+        httpd.daemon_threads = True
+        httpd.files = self.files
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        self.servers[address] = httpd
+        logging.info(f'{__name__}: serving packages on {address}:{port}')
+
+    def get_url(self, path: str, port: int, host: str) -> str:
+        """Publish a file and get URL a remote host can download it by; start
+        server on the local address facing the host if needed.
+
+        :param path: file to publish
+        :type path: str
+
+        :param port: TCP port
+        :type port: int
+
+        :param host: remote host
+        :type host: str
+
+        :return: URL
+        :rtype: str
+        """
+        # no packets are sent, connect() only picks the route
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect((host, port))
+            address = s.getsockname()[0]
+        path = os.path.abspath(path)
+        with self.lock:
+            self.start(address, port)
+            url_path = self.urls.get(path)
+            if url_path is None:
+                name = urllib.parse.quote(os.path.basename(path))
+                url_path = f'/{secrets.token_urlsafe(16)}/{name}'
+                self.urls[path] = url_path
+                self.files[url_path] = path
+        return f'http://{address}:{port}{url_path}'
+
+    def stop(self) -> None:
+        """Stop all servers and withdraw published files.
+        """
+        with self.lock:
+            for httpd in self.servers.values():
+                httpd.shutdown()
+                httpd.server_close()
+            self.servers.clear()
+            self.files.clear()
+            self.urls.clear()
+
+
+server = PackageServer()
@@ -0,0 +1,283 @@
+import os
+import stat
+import contextlib
+import time
+import queue
+import tarfile
+import zipfile
+import threading
+
+
+TAR_BUFSIZE = 1024 * 1024
+
+
+class Pipe:
+    """Bounded in-memory pipe: a producer thread writes to it as to a file,
+    consumer iterates over written chunks. The producer blocks while
+    maxsize chunks are pending, so memory use stays bounded.
+
+    :ivar queue: pending chunks; None marks the end of data
+    :ivar error: exception raised by the producer
+    :ivar aborted: True if the consumer gave up reading
+    """
+    def __init__(self, maxsize: int = 8):
+        self.queue = queue.Queue(maxsize)
+        self.error = None
+        self.aborted = False
+
+    def write(self, data: bytes) -> int:
+        if self.aborted:
+            raise BrokenPipeError('reader of the pipe is gone')
+        self.queue.put(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def run(self, produce) -> 'Pipe':
+        """Start producer thread.
+
+        :param produce: callable writing data to given file-like object
+        :type produce: Callable
+
+        :return: the pipe
+        :rtype: Pipe
+        """
+        def target():
+            try:
+                produce(self)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.put(None)
+
+        threading.Thread(target=target, daemon=True).start()
+        return self
+
+    def abort(self) -> None:
+        """Stop reading: unblock and fail the producer.
+        """
+        self.aborted = True
+        try:
+            while True:
+                self.queue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def __iter__(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                break
+            yield chunk
+        if self.error is not None and not self.aborted:
+            raise self.error
+
+
+class GrowingFile:
+    """File which is still being written (downloaded) and can be read by
+    any number of readers at the same time. The writer reports the size of
+    the contiguous written part; readers block until the data they need is
+    written. The file itself is the buffer, so slow readers hold back no
+    memory and the writer never waits for them. Readers open the file for
+    each chunk only; the writer moves or removes it in :meth:`exclusive`
+    section, as an open file can be neither renamed nor deleted on Windows.
+
+    :ivar part: path the file is written to
+    :ivar path: path the file is moved to when complete
+    :ivar cond: condition notified on progress
+    :ivar size: total size or None while unknown
+    :ivar done: size of the contiguous written part
+    :ivar finished: True once the file is complete and verified
+    :ivar error: exception which failed writing
+    :ivar readers: number of readers having the file open
+    :ivar locked: True while the writer moves or removes the file
+    :ivar moved: True once the file is at path
+    """
+    def __init__(self, part: str, path: str):
+        self.part = part
+        self.path = path
+        self.cond = threading.Condition()
+        self.size = None
+        self.done = 0
+        self.finished = False
+        self.error = None
+        self.readers = 0
+        self.locked = False
+        self.moved = part == path
+
+    def set_size(self, size: int) -> None:
+        with self.cond:
+            self.size = size
+            self.cond.notify_all()
+
+    def update(self, done: int) -> None:
+        with self.cond:
+            self.done = done
+            self.cond.notify_all()
+
+    def finish(self, error: BaseException = None) -> None:
+        """Mark file complete (it must be at path) or failed.
+
+        :param error: exception which failed writing
+        :type error: BaseException
+        """
+        with self.cond:
+            if error is None:
+                self.size = self.done = os.path.getsize(self.path)
+                self.finished = True
+            else:
+                self.error = error
+            self.cond.notify_all()
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        """Wait until no reader has the file open and keep new ones from
+        opening it within the section.
+        """
+        with self.cond:
+            while self.locked or self.readers:
+                self.cond.wait()
+            self.locked = True
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.locked = False
+                self.cond.notify_all()
+
+    def move(self) -> None:
+        """Move complete file from part to path.
+        """
+        with self.exclusive():
+            os.replace(self.part, self.path)
+            self.moved = True
+
+    @contextlib.contextmanager
+    def reading(self):
+        """Register a reader for the section, once the writer is not moving
+        the file.
+
+        :return: path the file is at
+        """
+        with self.cond:
+            while self.locked:
+                self.cond.wait()
+            self.readers += 1
+            path = self.path if self.moved else self.part
+        try:
+            yield path
+        finally:
+            with self.cond:
+                self.readers -= 1
+                self.cond.notify_all()
+
+    def wait(self, offset: int = None) -> int:
+        """Wait until data beyond offset is written or file is finished.
+
+        :param offset: offset to read from; None waits for the whole file
+        :type offset: int
+
+        :return: size of the contiguous written part
+        :rtype: int
+        """
+        with self.cond:
+            while self.error is None and not self.finished and \
+                    (offset is None or self.done <= offset):
+                self.cond.wait()
+            if self.error is not None:
+                raise self.error
+            return self.done
+
+    def get_size(self) -> int:
+        """Wait until total size is known.
+
+        :return: size
+        :rtype: int
+        """
+        with self.cond:
+            while self.error is None and self.size is None:
+                self.cond.wait()
+            if self.error is not None:
+                raise self.error
+            return self.size
+
+    def open(self) -> 'GrowingFileReader':
+        return GrowingFileReader(self)
+
+
+class GrowingFileReader:
+    """Sequential binary reader of :class:`GrowingFile`. End of file is
+    reported only after the file is finished, so a failed download (or
+    checksum mismatch) fails the reader instead of truncating the data.
+
+    :ivar file: file being read
+    :ivar offset: current position
+    """
+    def __init__(self, file: GrowingFile):
+        self.file = file
+        self.offset = 0
+
+    def read(self, size: int = -1) -> bytes:
+        end = self.file.wait(self.offset)
+        if self.offset >= end:
+            return b''
+        if size is None or size < 0:
+            size = end - self.offset
+        size = min(size, end - self.offset)
+        with self.file.reading() as path, open(path, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size)
+        self.offset += len(data)
+        return data
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def zip_to_tar(zip_path: str, fileobj, prefix: str = '') -> None:
+    """Convert zip archive to uncompressed tar stream on the fly, so that it
+    can be piped into ``tar -x`` without storing the archive. Unix
+    permissions and symbolic links kept in the zip are preserved.
+
+    :param zip_path: path to zip archive
+    :type zip_path: str
+
+    :param fileobj: writable binary file-like object
+
+    :param prefix: directory (with '/' separators) to put contents into
+    :type prefix: str
+    """
+    with zipfile.ZipFile(zip_path) as package, \
+            tarfile.open(fileobj=fileobj, mode='w|',
+                         bufsize=TAR_BUFSIZE) as tar:
+        parts = [p for p in prefix.split('/') if p]
+        for i in range(len(parts)):
+            tarinfo = tarfile.TarInfo('/'.join(parts[:i + 1]))
+            tarinfo.type = tarfile.DIRTYPE
+            tarinfo.mode = 0o755
+            tarinfo.mtime = time.time()
+            tar.addfile(tarinfo)
+        for info in package.infolist():
+            tarinfo = tarfile.TarInfo('/'.join(parts + [info.filename]))
+            tarinfo.mtime = time.mktime(info.date_time + (0, 0, -1))
+            mode = info.external_attr >> 16
+            if info.is_dir():
+                tarinfo.type = tarfile.DIRTYPE
+                tarinfo.mode = stat.S_IMODE(mode) or 0o755
+                tar.addfile(tarinfo)
+            elif stat.S_ISLNK(mode):
+                tarinfo.type = tarfile.SYMTYPE
+                tarinfo.linkname = package.read(info).decode()
+                tar.addfile(tarinfo)
+            else:
+                tarinfo.size = info.file_size
+                tarinfo.mode = stat.S_IMODE(mode) or 0o644
+                with package.open(info) as f:
+                    tar.addfile(tarinfo, f)